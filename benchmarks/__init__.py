@@ -0,0 +1,3 @@
+# @FILENAME : __init__.py
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
@@ -0,0 +1,85 @@
+# @FILENAME : bench_memory
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+"""统计 ZCoolScraper 下载阶段每个图片任务占用的内存，不访问网络、不写文件。
+
+    $ python -m benchmarks.bench_memory --tasks 200000
+
+依次报告：任务全部入队后、下载过程中的峰值、下载结束后（只剩 stat 等状态）的内存，
+以及折算到每百万个任务的大小。
+"""
+import argparse
+import time
+import tracemalloc
+from unittest import mock
+
+from scraper import zcool
+from scraper.storage import Storage
+from scraper.zcool import Scrapy, StorageSink, ZCoolScraper
+
+IMAGES_PER_WORK = 10
+
+
+class NullSink(StorageSink):
+    """丢弃图片内容的 sink。"""
+
+    def __init__(self):
+        super().__init__(Storage())
+
+    def exists(self, scrapy):
+        return False
+
+    def __call__(self, scrapy, chunks):
+        pass
+
+
+def make_tasks(n):
+    """按 parse_images 的方式生成 n 个图片任务：同一作品的图片共享作者及标题字符串。"""
+    for work in range(0, n, IMAGES_PER_WORK):
+        author = f'author-{work // IMAGES_PER_WORK % 100}'
+        title = f'作品标题 {work // IMAGES_PER_WORK}'
+        objid = str(10 ** 7 + work // IMAGES_PER_WORK)
+        for index in range(min(IMAGES_PER_WORK, n - work)):
+            url = f'https://img.zcool.cn/community/01{work + index:030x}.jpg'
+            yield Scrapy(type='image', author=author, title=title, objid=objid, index=index, url=url)
+
+
+def run(n, workers):
+    scraper = ZCoolScraper(max_workers=workers, keep_records=False, verbose=False, autorun=False)
+    scraper.sink = NullSink()
+
+    tracemalloc.start()
+    for scrapy in make_tasks(n):
+        scraper.works.setdefault(scrapy.objid, (next(scraper.work_order), IMAGES_PER_WORK))
+        scraper.images.put(scrapy)
+        scraper.stat['nimages'] += 1
+    queued, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+    with mock.patch.object(zcool, 'session_request', lambda url, method='GET', stream=False: None):
+        scraper.run_scraper()
+    # 线程退出后释放各线程复用的下载缓冲区，retained 只统计任务状态
+    scraper.shutdown()
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(scraper.stat['images_pass']) == n
+    return queued, peak, retained, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', default=200000, type=int)
+    parser.add_argument('--workers', default=zcool.MAX_WORKERS, type=int)
+    args = parser.parse_args()
+
+    queued, peak, retained, elapsed = run(args.tasks, args.workers)
+    scale = 1000000 / args.tasks / 1024 / 1024
+    for name, size in (('queued', queued), ('peak', peak), ('retained', retained)):
+        print(f'{name.rjust(8)}: {size / args.tasks:6.0f} B/task, {size * scale:7.1f} MB per million tasks')
+    print(f'{args.tasks} tasks in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# @FILENAME : bench_transport
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+"""对比 requests 连接池与共享 httpx 客户端（HTTP/2）的下载吞吐量。
+
+    $ python -m benchmarks.bench_transport --images 500 --size 204800
+    $ python -m benchmarks.bench_transport --tls --http2
+    $ python -m benchmarks.bench_transport --base-url https://localhost:8443 --http2
+
+明文的本地模拟 CDN 只支持 HTTP/1.1，httpx 此时不会协商 HTTP/2；``--tls`` 时本地模拟 CDN 使用自签名证书，
+通过 ALPN 协商 HTTP/2（需安装 h2 及 cryptography），也可以通过 ``--base-url`` 指定其他服务端。
+每行结果按实际协商的协议版本标注。
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_cdn import serve
+from scraper import zcool
+
+
+def protocol(base_url, http2):
+    """返回实际使用的客户端及协议版本，如 requests/HTTP/1.1、httpx/HTTP/2。"""
+    resp = zcool.session_request(f'{base_url}/0/probe.jpg')
+    if http2:
+        return f'httpx/{resp.http_version}'
+    return f'requests/HTTP/{resp.raw.version / 10:.1f}'
+
+
+def run(base_url, images, size, workers):
+    urls = [f'{base_url}/{size}/{i}.jpg' for i in range(images)]
+
+    def fetch(url):
+        return sum(len(chunk) for chunk in zcool.iter_content(zcool.session_request(url)))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        total = sum(pool.map(fetch, urls))
+    return time.perf_counter() - start, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='Benchmark server, defaults to the local mock CDN.')
+    parser.add_argument('--images', default=500, type=int)
+    parser.add_argument('--size', default=200 * 1024, type=int, help='Bytes per image.')
+    parser.add_argument('--workers', default=zcool.MAX_WORKERS, type=int)
+    parser.add_argument('--http2', action='store_true', help='Also run with the shared HTTP/2 client.')
+    parser.add_argument('--tls', action='store_true', help='Serve the local mock CDN over HTTPS with h2.')
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    if not base_url:
+        server, base_url = serve(tls=args.tls)
+        if args.tls:
+            # requests 与 httpx 分别从这两个环境变量读取信任的证书
+            os.environ['REQUESTS_CA_BUNDLE'] = os.environ['SSL_CERT_FILE'] = server.cafile
+    modes = [False, True] if args.http2 else [False]
+    for http2 in modes:
+        zcool.configure_transport(args.workers, http2)
+        name = protocol(base_url, http2)
+        zcool.transport_stats.clear()
+        elapsed, total = run(base_url, args.images, args.size, args.workers)
+        print(f'{name}: {args.images} images, '
+              f'{total / elapsed / 1024 / 1024:.1f} MB/s, {args.images / elapsed:.1f} images/s, '
+              f'{zcool.get_transport_stats()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+# @FILENAME : bench_write
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+"""对比逐 8 KB 块写入与复用大缓冲区写入图片的耗时、CPU 时间及内存分配。
+
+    $ python -m benchmarks.bench_write --images 200 --size 4194304
+
+模拟 CDN 运行在独立的进程中，CPU 时间只统计下载进程。
+"""
+import argparse
+import multiprocessing
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from scraper import zcool
+from scraper.storage import LocalStorage
+
+
+def serve_cdn(queue):
+    from benchmarks.mock_cdn import serve
+    queue.put(serve()[1])
+    threading.Event().wait()
+
+
+def write_chunks(storage, scrapy):
+    """旧的写入方式：iter_content(8192) 逐块写入。"""
+    resp = zcool.session_request(scrapy.url, stream=True)
+    try:
+        storage.write(f'{scrapy.index}.jpg', zcool.iter_content(resp, zcool.CHUNK_SIZE))
+    finally:
+        resp.close()
+
+
+def write_blocks(storage, scrapy):
+    """新的写入方式：读入线程复用的缓冲区，按 Content-Length 预分配后整块写入。"""
+    chunks = zcool.stream_image(scrapy, buffer=zcool.thread_buffer())
+    storage.write(f'{scrapy.index}.jpg', chunks, chunks.size)
+
+
+def run(func, base_url, images, size, workers):
+    tasks = [zcool.Scrapy(type='image', author='', title='', objid='', index=i,
+                          url=f'{base_url}/{size}/{i}.jpg') for i in range(images)]
+    with tempfile.TemporaryDirectory() as directory:
+        storage = LocalStorage(directory)
+        tracemalloc.start()
+        start, cpu = time.perf_counter(), time.process_time()
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(lambda scrapy: func(storage, scrapy), tasks))
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, cpu, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='Benchmark server, defaults to the local mock CDN.')
+    parser.add_argument('--images', default=200, type=int)
+    parser.add_argument('--size', default=4 * 1024 * 1024, type=int, help='Bytes per image.')
+    parser.add_argument('--workers', default=4, type=int)
+    args = parser.parse_args()
+
+    base_url = args.base_url
+    if not base_url:
+        queue = multiprocessing.Queue()
+        multiprocessing.Process(target=serve_cdn, args=(queue,), daemon=True).start()
+        base_url = queue.get()
+
+    zcool.configure_transport(args.workers)
+    total = args.images * args.size / 1024 / 1024
+    for name, func in (('8 KB chunks', write_chunks), ('reused blocks', write_blocks)):
+        zcool.transport_stats.clear()
+        elapsed, cpu, peak = run(func, base_url, args.images, args.size, args.workers)
+        print(f'{name.rjust(13)}: {total / elapsed:7.1f} MB/s, CPU {cpu:.2f}s ({cpu / total * 1000:.2f} ms/MB), '
+              f'peak traced memory {peak / 1024:.0f} KB, {zcool.get_transport_stats()}')
+
+
+if __name__ == '__main__':
+    main()
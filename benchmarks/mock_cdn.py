@@ -0,0 +1,163 @@
+# @FILENAME : mock_cdn
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+"""本地模拟图片 CDN，用于基准测试。
+
+请求 ``/<size>/<name>.jpg`` 返回 ``size`` 字节的内容，支持 keep-alive。
+默认为明文 HTTP/1.1；``tls=True`` 时使用临时生成的自签名证书提供 HTTPS，并通过 ALPN 协商 HTTP/2
+（需安装 h2 及 cryptography），客户端需信任 ``server.cafile``。
+"""
+import argparse
+import datetime
+import ipaddress
+import os
+import ssl
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import h2.config
+    import h2.connection
+    import h2.events
+except ImportError:
+    h2 = None
+
+PAYLOAD = os.urandom(16 * 1024 * 1024)
+
+
+def payload_size(path: str) -> int:
+    """解析 /<size>/<name>.jpg 中的大小。"""
+    try:
+        return min(int(path.strip('/').split('/')[0]), len(PAYLOAD))
+    except ValueError:
+        return 0
+
+
+class CDNHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def handle(self):
+        selected = getattr(self.connection, 'selected_alpn_protocol', lambda: None)()
+        if selected == 'h2':
+            self.handle_h2()
+        else:
+            super().handle()
+
+    def handle_h2(self):
+        """在一个 TLS 连接上处理多路复用的 HTTP/2 请求，按对端的流控窗口分帧发送内容。"""
+        conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding='utf-8'))
+        conn.initiate_connection()
+        sock = self.connection
+        sock.sendall(conn.data_to_send())
+        pending = {}  # stream_id -> 未发送的内容
+        while True:
+            for stream_id, body in list(pending.items()):
+                while body:
+                    size = min(conn.local_flow_control_window(stream_id), conn.max_outbound_frame_size, len(body))
+                    if size <= 0:
+                        break
+                    conn.send_data(stream_id, bytes(body[:size]))
+                    body = body[size:]
+                if body:
+                    pending[stream_id] = body
+                else:
+                    conn.end_stream(stream_id)
+                    del pending[stream_id]
+            sock.sendall(conn.data_to_send())
+            data = sock.recv(65536)
+            if not data:
+                return
+            for event in conn.receive_data(data):
+                if isinstance(event, h2.events.RequestReceived):
+                    size = payload_size(dict(event.headers)[':path'])
+                    conn.send_headers(event.stream_id, [(':status', '200'), ('content-type', 'image/jpeg'),
+                                                        ('content-length', str(size))])
+                    pending[event.stream_id] = memoryview(PAYLOAD)[:size]
+                elif isinstance(event, h2.events.StreamReset):
+                    pending.pop(event.stream_id, None)
+                elif isinstance(event, h2.events.ConnectionTerminated):
+                    return
+
+    def do_GET(self):
+        size = payload_size(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        self.wfile.write(PAYLOAD[:size])
+
+    def log_message(self, format, *args):
+        pass
+
+
+def self_signed_cert(host: str, directory: str) -> str:
+    """生成 host 的自签名证书及私钥，写入同一个 PEM 文件。
+
+    :param str host: 证书的域名或 IP
+    :param str directory: 保存目录
+    :return str: PEM 文件路径，同时可作为客户端信任的 CA 文件
+    """
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.x509.oid import NameOID
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, host)])
+    try:
+        alt_name = x509.IPAddress(ipaddress.ip_address(host))
+    except ValueError:
+        alt_name = x509.DNSName(host)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1)).not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([alt_name]), critical=False)
+            .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+            .sign(key, hashes.SHA256()))
+    path = os.path.join(directory, 'cert.pem')
+    with open(path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    return path
+
+
+def serve(host='127.0.0.1', port=0, tls=False):
+    """在后台线程启动模拟 CDN。
+
+    :param str host: 监听地址
+    :param int port: 监听端口，0 为随机端口
+    :param bool tls: 是否使用 HTTPS，安装了 h2 时同时支持 HTTP/2
+    :return tuple: (server, base_url)，tls 为 True 时 server.cafile 为客户端需信任的证书
+    """
+    server = ThreadingHTTPServer((host, port), CDNHandler)
+    server.daemon_threads = True
+    scheme = 'http'
+    if tls:
+        server.certdir = tempfile.TemporaryDirectory()
+        server.cafile = self_signed_cert(host, server.certdir.name)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(server.cafile)
+        context.set_alpn_protocols(['h2', 'http/1.1'] if h2 is not None else ['http/1.1'])
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'{scheme}://{host}:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local mock image CDN.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', default=8000, type=int)
+    parser.add_argument('--tls', action='store_true', help='Serve HTTPS with a self-signed cert, with h2 if installed.')
+    args = parser.parse_args()
+    server, base_url = serve(args.host, args.port, args.tls)
+    print(f'Serving on {base_url}, Ctrl+C to stop.')
+    if args.tls:
+        print(f'Trust the self-signed cert with SSL_CERT_FILE={server.cafile} REQUESTS_CA_BUNDLE={server.cafile}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,9 @@
+# @FILENAME : daemon
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import sys
+
+from scraper.daemon import daemon_command
+
+if __name__ == '__main__':
+    sys.exit(daemon_command())
@@ -0,0 +1,9 @@
+# @FILENAME : dedupe
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import sys
+
+from scraper.dedupe import dedupe_command
+
+if __name__ == '__main__':
+    sys.exit(dedupe_command())
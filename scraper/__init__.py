@@ -1,13 +1,24 @@
 # @FILENAME : __init__.py
 # @AUTHOR : lonsty
 # @DATE : 2019/9/9 11:04
-from .zcool import ZCoolScraper, zcool_command
+from .storage import LocalStorage, S3Storage, Storage, open_storage
+from .zcool import (DirectorySink, StorageSink, ZCoolError, ZCoolScraper,
+                    download, iter_images, zcool_command)
 
 __author__ = 'lonsty'
 __email__ = 'lonsty@sina.com'
 __version__ = '0.1.4'
 
 __all__ = [
+    'DirectorySink',
+    'LocalStorage',
+    'S3Storage',
+    'Storage',
+    'StorageSink',
+    'ZCoolError',
     'ZCoolScraper',
+    'download',
+    'iter_images',
+    'open_storage',
     'zcool_command'
 ]
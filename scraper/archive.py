@@ -0,0 +1,172 @@
+# @FILENAME : archive
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import io
+import json
+import tarfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Iterable
+
+from scraper.storage import Storage
+from scraper.utils import MB, mkdirs_if_not_exist
+
+ARCHIVE_FORMATS = ('tar', 'zip')
+SHARD_SIZE = 1024 * MB
+INDEX_FILE = 'index.jsonl'
+
+
+class ShardedArchive(Storage):
+    """将图片直接写入大小受限的 tar 或 zip 分片，不在磁盘上生成单个图片文件。
+
+    分片依次命名为 shard-00000.tar、shard-00001.tar ...，每写入一个文件就在 index.jsonl 中
+    追加一行 ``{"name", "shard", "offset", "size"}``，offset 为文件数据（tar）或文件头（zip）
+    在分片中的偏移。再次打开同一目录时读取索引，已存在的文件可跳过，新文件写入新的分片。
+
+    进程异常退出时，zip 分片缺少中央目录，tar 分片的最后一个文件可能不完整。读取索引时会检查
+    每个分片，丢弃无法从分片中读出的条目并重写索引，这些文件在下次运行时重新下载。
+    """
+
+    def __init__(self, directory, fmt: str = 'tar', shard_size: int = SHARD_SIZE):
+        """
+        :param str directory: 分片及索引的保存目录
+        :param str fmt: 分片格式，tar 或 zip
+        :param int shard_size: 单个分片的最大字节数，单个文件超过此大小时独占一个分片
+        """
+        if fmt not in ARCHIVE_FORMATS:
+            raise ValueError(f'Unsupported archive format: {fmt}')
+        self.directory = Path(directory)
+        self.fmt = fmt
+        self.shard_size = shard_size
+        self.count = 0
+        self._names = set()
+        self._shard = None
+        self._shard_no = 0
+        self._shard_bytes = 0
+        self._index = None
+        self._lock = threading.Lock()
+
+        index_path = self.directory / INDEX_FILE
+        if index_path.is_file():
+            with open(index_path, 'r', encoding='utf-8') as f:
+                entries = [json.loads(line) for line in f if line.strip()]
+            readable = {}
+            valid = []
+            for entry in entries:
+                # 损坏的分片也不再写入，新文件总是写入编号更大的分片
+                self._shard_no = max(self._shard_no, entry['shard'] + 1)
+                if entry['shard'] not in readable:
+                    readable[entry['shard']] = self._readable_names(entry['shard'])
+                if entry['name'] in readable[entry['shard']]:
+                    self._names.add(entry['name'])
+                    valid.append(entry)
+            if len(valid) < len(entries):
+                tmp = index_path.with_suffix('.tmp')
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    f.writelines(json.dumps(entry, ensure_ascii=False) + '\n' for entry in valid)
+                tmp.replace(index_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f'{self.directory}/shard-*.{self.fmt}'
+
+    def exists(self, name: str) -> bool:
+        """文件是否已写入分片。
+
+        :param str name: 文件在分片中的路径
+        """
+        return name in self._names
+
+    def _shard_path(self, shard_no):
+        return self.directory / f'shard-{shard_no:05d}.{self.fmt}'
+
+    def _readable_names(self, shard_no) -> set:
+        """返回分片中内容完整、可以读出的文件名，分片无法打开时返回空集合。"""
+        path = self._shard_path(shard_no)
+        names = set()
+        try:
+            if self.fmt == 'zip':
+                with zipfile.ZipFile(path) as zf:
+                    names.update(zf.namelist())
+            else:
+                file_size = path.stat().st_size
+                # 截断的 tar 读到不完整的文件头时出错，保留在此之前的完整文件
+                with tarfile.open(path, 'r') as tar:
+                    for info in tar:
+                        if info.offset_data + info.size <= file_size:
+                            names.add(info.name)
+        except (OSError, tarfile.TarError, zipfile.BadZipFile):
+            pass
+        return names
+
+    def _open_shard(self):
+        mkdirs_if_not_exist(self.directory)
+        path = self._shard_path(self._shard_no)
+        if self.fmt == 'tar':
+            self._shard = tarfile.open(path, 'w')
+        else:
+            self._shard = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        self._shard_bytes = 0
+        if self._index is None:
+            self._index = open(self.directory / INDEX_FILE, 'a', encoding='utf-8')
+
+    def _close_shard(self):
+        self._shard.close()
+        self._shard = None
+        self._shard_no += 1
+
+    def write(self, name: str, chunks: Iterable[bytes], size: int = None):
+        """将文件内容写入当前分片，当前分片写满时切换到新的分片。
+
+        内容先在内存中拼接（tar 需要预先知道文件大小），再在锁内写入分片。
+
+        :param str name: 文件在分片中的路径
+        :param Iterable[bytes] chunks: 文件内容块
+        :param int size: 预计的文件大小，未使用
+        """
+        buffer = io.BytesIO()
+        for chunk in chunks:
+            buffer.write(chunk)
+        size = buffer.tell()
+        buffer.seek(0)
+
+        with self._lock:
+            if self._shard is not None and self._shard_bytes and self._shard_bytes + size > self.shard_size:
+                self._close_shard()
+            if self._shard is None:
+                self._open_shard()
+
+            if self.fmt == 'tar':
+                info = tarfile.TarInfo(name)
+                info.size = size
+                info.mtime = time.time()
+                self._shard.addfile(info, buffer)
+                # 文件数据按 512 字节块对齐，位于写入后偏移之前
+                offset = self._shard.offset - -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            else:
+                info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+                self._shard.writestr(info, buffer.getbuffer())
+                offset = info.header_offset
+
+            self._shard_bytes += size
+            self._names.add(name)
+            self.count += 1
+            entry = {'name': name, 'shard': self._shard_no, 'offset': offset, 'size': size}
+            self._index.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self._index.flush()
+
+    def close(self):
+        """关闭当前分片及索引文件。"""
+        with self._lock:
+            if self._shard is not None:
+                self._close_shard()
+            if self._index is not None:
+                self._index.close()
+                self._index = None
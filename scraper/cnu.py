@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # @Author: eilianxiao
 # @Date: Dec 26 18:44 2020
+import asyncio
 import json
+from datetime import datetime
 from pathlib import Path
 from typing import List
 
@@ -9,7 +11,11 @@ import aiofiles
 import typer
 from ruia import AttrField, Item, Spider, TextField
 
-from scraper.utils import mkdirs_if_not_exist, safe_filename
+from scraper.archive import ARCHIVE_FORMATS, SHARD_SIZE, ShardedArchive
+from scraper.records import METADATA_FORMATS, MetadataWriter
+from scraper.storage import LocalStorage, is_remote, open_storage
+from scraper.utils import (MB, Fingerprints, TokenBucket, mkdirs_if_not_exist,
+                           safe_filename)
 
 IMAGE_HOST = 'http://imgoss.cnu.cc/'
 AUTHOR_RCMDS_PREFIX = 'http://www.cnu.cc/users/recommended/'
@@ -25,7 +31,7 @@ START_URLS = [
     'http://www.cnu.cc/users/{id}',  # 用户作品页 URL
     'http://www.cnu.cc/users/recommended/{id}',  # 用户推荐页 URL
 ]
-DESTINATION = Path('.')
+DESTINATION = '.'
 OVERWRITE = False
 THUMBNAIL = False
 WORKER_NUMBERS = 2
@@ -34,6 +40,13 @@ RETRIES = 3
 DELAY = 0
 RETRY_DELAY = 0
 TIMEOUT = 20
+MAX_BANDWIDTH = None
+CHUNK_SIZE = MB  # 图片内容每次读取、写入的块大小
+STREAM_BLOCKS = 2  # 写入非本地存储时，等待写入的最大块数
+ARCHIVE = None
+METADATA_ONLY = False
+METADATA_FORMAT = 'jsonl'
+FINGERPRINTS = None
 
 
 class PageItem(Item):
@@ -72,22 +85,46 @@ class CNUSpider(Spider):
         self._destination = DESTINATION
         self._overwrite = OVERWRITE
         self._thumbnail = THUMBNAIL
+        self._limiter = None
+        self._metadata = None
+        self._storage = None
+        self._fingerprints = None
+        # 尚未保存完成的图片数，作品的图片全部保存后才持久化作品的指纹
+        self._pending = {}
         # 更新 Spider 及自定义的配置
         for k, v in kwargs.get('spider_config', {}).items():
             setattr(self, k, v)
+        if self._storage is None:
+            self._storage = open_storage(self._destination).sub(BASE_DIR)
+        if self._fingerprints is None:
+            self._fingerprints = Fingerprints()
+
+    def request_once(self, url, **kwargs):
+        """请求未发出过时返回 Request，否则返回 None，重复的请求不会进入队列。"""
+        if self._fingerprints.add(url):
+            return self.request(url=url, **kwargs)
+        self.logger.info(f'Skipped duplicate request: {url}')
+
+    async def process_start_urls(self):
+        for url in self.start_urls:
+            request = self.request_once(url, callback=self.parse, metadata=self.metadata)
+            if request:
+                yield request
 
     async def parse(self, response):
         if response.url.startswith(AUTHOR_WORKS_PREFIX):
             async for page_item in PageItem.get_items(html=await response.text()):
                 for page in range(1, int(page_item.max_page) + 1):
                     page_url = f'{response.url.split("?")[0]}{PAGE_SUFFIX.format(page=page)}'
-                    yield self.request(
-                        url=page_url,
+                    request = self.request_once(
+                        page_url,
                         metadata={
                             'current_page': page,
                             'max_page': page_item.max_page,
                         },
                         callback=self.parse_page)
+                    if request:
+                        yield request
         elif response.url.startswith(WORK_PREFIX):
             yield self.parse_work(response)
         else:
@@ -95,8 +132,8 @@ class CNUSpider(Spider):
 
     async def parse_page(self, response):
         async for work_item in WorkItem.get_items(html=await response.text()):
-            yield self.request(
-                url=work_item.work,
+            request = self.request_once(
+                work_item.work,
                 metadata={
                     'current_page': response.metadata['current_page'],
                     'max_page': response.metadata['max_page'],
@@ -106,20 +143,30 @@ class CNUSpider(Spider):
                 },
                 callback=self.parse_work
             )
+            if request:
+                yield request
 
     async def parse_work(self, response):
         async for images_item in ImagesItem.get_items(html=await response.text()):
             urls = [IMAGE_HOST + img.get('img') for img in json.loads(images_item.imgs_json)]
+            if self._metadata:
+                objid = response.url.split('?')[0].rstrip('/').split('/')[-1]
+                for index, url in enumerate(urls):
+                    self._metadata.write({'author': images_item.author, 'title': images_item.title,
+                                          'objid': objid, 'index': index, 'url': url})
+                continue
+            pending = 0
             for index, url in enumerate(urls):
                 basename = url.split('/')[-1]
-                save_dir = (self._destination /
-                            BASE_DIR /
-                            safe_filename(images_item.author) /
-                            safe_filename(images_item.title))
-                fpath = save_dir / f'[{index + 1:02d}]{basename}'
-                if self._overwrite or not fpath.is_file():
-                    if self._thumbnail:
-                        url += THUMBNAIL_SUFFIX
+                path = (f'{safe_filename(images_item.author)}/{safe_filename(images_item.title)}/'
+                        f'[{index + 1:02d}]{basename}')
+                if self._thumbnail:
+                    url += THUMBNAIL_SUFFIX
+                if url in self._fingerprints:
+                    self.logger.info(f'Skipped duplicate request: {url}')
+                elif self._overwrite or not await self.run_blocking(self._storage.exists, path):
+                    self._fingerprints.add(url)
+                    pending += 1
                     self.logger.info(f'Downloading {url} ...')
                     yield self.request(
                         url=url,
@@ -128,29 +175,149 @@ class CNUSpider(Spider):
                             'index': index,
                             'url': url,
                             'basename': basename,
-                            'save_dir': save_dir,
-                            'fpath': fpath
+                            'path': path,
+                            'work': response.url
                         },
                         callback=self.save_image
                     )
                 else:
-                    self.logger.info(f'Skipped already exists: {fpath}')
+                    self._fingerprints.persist(url)
+                    self.logger.info(f'Skipped already exists: {self._storage}/{path}')
+            if pending:
+                self._pending[response.url] = self._pending.get(response.url, 0) + pending
+            else:
+                self._fingerprints.persist(response.url)
+
+    async def run_blocking(self, func, *args):
+        """本地文件系统直接调用，其他存储后端的阻塞调用在线程池中执行，以免阻塞事件循环。"""
+        if isinstance(self._storage, LocalStorage):
+            return func(*args)
+        return await asyncio.get_event_loop().run_in_executor(None, func, *args)
 
     async def save_image(self, response):
+        path = response.metadata['path']
+        if not isinstance(self._storage, LocalStorage):
+            # 边读取边交给线程池中的存储后端写入，内存中最多缓存 STREAM_BLOCKS 块
+            try:
+                await write_stream(self._storage, path, iter_chunks(response, self._limiter))
+            except Exception as e:
+                self.logger.error(e)
+            else:
+                self.logger.info(f'Saved to {self._storage}/{path}')
+                self.saved(response.metadata)
+            return
+
         # 创建图片保存目录
-        save_dir = response.metadata['save_dir']
+        fpath = self._storage.root / path
+        save_dir = fpath.parent
         if mkdirs_if_not_exist(save_dir):
             self.logger.info(f'Created directory: {save_dir}')
-        # 保存图片
-        fpath = response.metadata['fpath']
+        # 保存图片：先写入 .part 文件，读完最后一块后再重命名，下载中断时不会留下不完整的图片
+        tmp = fpath.with_name(f'{fpath.name}.part')
         try:
-            content = await response.read()
-        except TypeError as e:
+            async with aiofiles.open(tmp, 'wb') as f:
+                async for chunk in iter_chunks(response, self._limiter):
+                    await f.write(chunk)
+            tmp.replace(fpath)
+        except BaseException as e:
+            # 停止爬虫时 ruia 取消任务抛出的 CancelledError 不是 Exception 的子类
+            if tmp.is_file():
+                tmp.unlink()
+            if not isinstance(e, Exception):
+                raise
             self.logger.error(e)
         else:
-            async with aiofiles.open(fpath, 'wb') as f:
-                await f.write(content)
-                self.logger.info(f'Saved to {fpath}')
+            self.logger.info(f'Saved to {fpath}')
+            self.saved(response.metadata)
+
+    def saved(self, metadata):
+        """持久化已保存图片的指纹，作品的图片全部保存后持久化作品的指纹。"""
+        self._fingerprints.persist(metadata['url'])
+        work = metadata['work']
+        self._pending[work] -= 1
+        if not self._pending[work]:
+            del self._pending[work]
+            self._fingerprints.persist(work)
+
+
+async def write_stream(storage, path: str, chunks, maxsize: int = STREAM_BLOCKS):
+    """在线程池中调用 storage.write，通过有界队列把异步读取的内容块逐块交给它。
+
+    读取出错或任务被取消时，异常被传给 storage.write，以便其中止写入（如 S3 的分段上传）。
+
+    :param Storage storage: 存储后端
+    :param str path: 文件路径
+    :param AsyncIterator[bytes] chunks: 内容块
+    :param int maxsize: 队列中最多缓存的块数
+    """
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue(maxsize)
+
+    def blocks():
+        while True:
+            item = asyncio.run_coroutine_threadsafe(queue.get(), loop).result()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    writer = loop.run_in_executor(None, storage.write, path, blocks())
+    put = None
+    try:
+        async for chunk in chunks:
+            # 写入线程出错退出时不再等待队列空出位置
+            put = asyncio.ensure_future(queue.put(chunk))
+            await asyncio.wait([put, writer], return_when=asyncio.FIRST_COMPLETED)
+            if not put.done():
+                put.cancel()
+                break
+        else:
+            await queue.put(None)
+    except BaseException as e:
+        if put is not None:
+            put.cancel()
+        if not writer.done():
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(e)
+        # 等待写入线程退出，再抛出原来的异常
+        await asyncio.wait([writer])
+        if not writer.cancelled():
+            writer.exception()
+        raise
+    await writer
+
+
+async def iter_chunks(response, limiter=None, chunk_size=CHUNK_SIZE):
+    """逐块读取响应内容，每块读满 chunk_size 后才产出（最后一块除外），减少写入次数。
+
+    ruia 的 Response 没有暴露数据流，这里通过其 read 方法所绑定的 aiohttp 响应读取；
+    无法获取时退回到一次性读取。
+
+    :param response: ruia 的 Response
+    :param TokenBucket limiter: 带宽限速器
+    :param int chunk_size: 块大小
+    :return AsyncIterator[bytes]: 响应内容块
+    """
+    resp = getattr(response._aws_read, '__self__', None)
+    if resp is None or not hasattr(resp, 'content'):
+        content = await response.read()
+        if limiter:
+            await limiter.consume_async(len(content))
+        yield content
+        return
+    while True:
+        try:
+            chunk = await resp.content.readexactly(chunk_size)
+        except asyncio.IncompleteReadError as e:
+            chunk = e.partial
+        if chunk:
+            if limiter:
+                await limiter.consume_async(len(chunk))
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
 
 
 def cnu_command(
@@ -158,9 +325,9 @@ def cnu_command(
             ...,
             help='URLs of the works'
         ),
-        destination: Path = typer.Option(
+        destination: str = typer.Option(
             DESTINATION, '-d', '--destination',
-            help='Destination directory to save the images'
+            help='Destination directory to save the images, or s3://<bucket>/<prefix>'
         ),
         overwrite: bool = typer.Option(
             OVERWRITE, '-o / -no', '--overwrite / --no-overwrite',
@@ -194,8 +361,54 @@ def cnu_command(
             TIMEOUT, '--timeout',
             help='Seconds of HTTP request timeout'
         ),
+        max_bandwidth: float = typer.Option(
+            MAX_BANDWIDTH, '--max-bandwidth',
+            help='Maximum download bandwidth shared by all workers, in MB/s'
+        ),
+        archive: str = typer.Option(
+            ARCHIVE, '--archive',
+            help=f'Write images into size-bounded shards instead of single files: {", ".join(ARCHIVE_FORMATS)}'
+        ),
+        shard_size: float = typer.Option(
+            SHARD_SIZE // MB, '--shard-size',
+            help='Maximum size of each archive shard, in MB'
+        ),
+        metadata_only: bool = typer.Option(
+            METADATA_ONLY, '--metadata-only',
+            help='Export image metadata only, without downloading images'
+        ),
+        metadata_format: str = typer.Option(
+            METADATA_FORMAT, '--metadata-format',
+            help=f'File format of the exported metadata: {", ".join(METADATA_FORMATS)}'
+        ),
+        fingerprints: Path = typer.Option(
+            FINGERPRINTS, '--fingerprints',
+            help='File to remember finished work and image requests, which are skipped in later runs'
+        ),
 ):
     """ A scraper to download images from http://www.cnu.cc/"""
+    # 元数据及分片保存在本地，保存到对象存储时保存在当前路径下
+    local = '.' if is_remote(destination) else destination
+    metadata = None
+    if metadata_only:
+        filename = f'{safe_filename(datetime.now().isoformat()[:-7])}.metadata.{metadata_format}'
+        try:
+            metadata = MetadataWriter(Path(local, BASE_DIR, filename), metadata_format)
+        except (ImportError, ValueError) as e:
+            typer.secho(str(e), fg=typer.colors.RED)
+            raise typer.Exit(1)
+
+    try:
+        if archive:
+            storage = ShardedArchive(Path(local, BASE_DIR), archive, int(shard_size * MB))
+        else:
+            storage = open_storage(destination).sub(BASE_DIR)
+    except (ImportError, ValueError) as e:
+        typer.secho(str(e), fg=typer.colors.RED)
+        raise typer.Exit(1)
+
+    # 只导出元数据时不持久化指纹，以免之后的下载跳过这些作品
+    seen = Fingerprints(None if metadata_only else fingerprints)
     # 开始爬虫任务
     CNUSpider.start(
         spider_config=dict(
@@ -209,7 +422,17 @@ def cnu_command(
             _destination=destination,
             _overwrite=overwrite,
             _thumbnail=thumbnail,
+            _limiter=TokenBucket(max_bandwidth * MB) if max_bandwidth else None,
+            _metadata=metadata,
+            _storage=storage,
+            _fingerprints=seen,
             worker_numbers=worker_numbers,
             concurrency=concurrency
         )
     )
+    seen.close()
+    if archive:
+        storage.close()
+    if metadata:
+        metadata.close()
+        typer.echo(f'Saved metadata of {metadata.count} images to {metadata.path.absolute()}')
@@ -0,0 +1,354 @@
+# @FILENAME : daemon
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote
+
+import click
+from termcolor import cprint
+
+from scraper.storage import open_storage
+from scraper.utils import MB, Fingerprints, TaskSet, TokenBucket
+from scraper.zcool import MAX_WORKERS, ZCoolScraper
+
+INTERVAL = 3600
+PORT = 8321
+JITTER = 0.1  # 每次同步后的下次同步时间在 interval 的 ±10% 内随机，错开各目标
+TARGET_KINDS = ('username', 'id', 'collection', 'cnu')
+
+
+def target_key(target: dict) -> str:
+    """返回目标的唯一标识，如 username:alice、cnu:http://www.cnu.cc/users/142231。
+
+    :param dict target: 监视目标，username、id、collection、cnu 中有且只有一项
+    :return str: 标识
+    """
+    kinds = [kind for kind in TARGET_KINDS if target.get(kind)]
+    if len(kinds) != 1:
+        raise ValueError(f'A target needs exactly one of {", ".join(TARGET_KINDS)}: {target}')
+    return f'{kinds[0]}:{target[kinds[0]]}'
+
+
+class Daemon(object):
+    """常驻进程，按各自的间隔重复同步监视列表中的站酷用户、收藏集及 CNU URL。
+
+    同一进程中的多次同步共享 HTTP 连接池、用户名到 ID 的映射、每个目标已解析的作品及已下载的图片（TaskSet），
+    以及 CNU 已完成请求的指纹，再次同步时只请求主页及新增的作品。
+    站酷的同步有图片下载失败时，下次同步重新解析该目标的所有作品，只下载之前未成功的图片。
+    监视列表保存在 JSON 文件中，通过控制接口增删目标时同步更新该文件。
+    """
+
+    def __init__(self, watch_file, destination=None, interval: int = INTERVAL, max_workers: int = MAX_WORKERS,
+                 http2: bool = False, max_bandwidth: float = None, thumbnail: bool = False, verbose: bool = True):
+        """
+        :param str watch_file: 监视列表文件，JSON 数组，每项如 {"username": "alice", "interval": 3600}
+        :param str destination: 图片的保存路径
+        :param int interval: 未指定 interval 的目标的同步间隔，秒
+        :param int max_workers: 站酷下载的线程数
+        :param bool http2: 是否使用 HTTP/2 多路复用连接
+        :param float max_bandwidth: 最大下载带宽，MB/s
+        :param bool thumbnail: 是否下载缩略图
+        :param bool verbose: 是否在终端输出同步结果
+        """
+        self.watch_file = Path(watch_file)
+        self.destination = destination
+        self.interval = interval
+        self.max_workers = max_workers
+        self.http2 = http2
+        self.max_bandwidth = max_bandwidth
+        self.thumbnail = thumbnail
+        self.verbose = verbose
+        self.targets = {}
+        self.next_runs = {}
+        self.status = {}
+        self.user_ids = {}
+        self.passed = {}
+        self.fingerprints = Fingerprints()
+        self.stopped = False
+        self._cond = threading.Condition()
+
+        if self.watch_file.is_file():
+            with open(self.watch_file, 'r', encoding='utf-8') as f:
+                for target in json.load(f):
+                    self.add(target, save=False)
+
+    def echo(self, message, color=None):
+        if self.verbose:
+            cprint(f'[{datetime.now().strftime("%Y-%m-%d %H:%M:%S")}] {message}', color)
+
+    def save(self):
+        """将监视列表写回文件。"""
+        with open(self.watch_file, 'w', encoding='utf-8') as f:
+            json.dump(list(self.targets.values()), f, ensure_ascii=False, indent=2)
+
+    def add(self, target: dict, save: bool = True) -> str:
+        """添加目标，首次同步时间在一个间隔内随机分布，避免所有目标同时同步。
+
+        :param dict target: 监视目标
+        :param bool save: 是否写回监视列表文件
+        :return str: 目标标识
+        """
+        key = target_key(target)
+        interval = target.get('interval')
+        # 先校验再修改状态，无效的目标不会留在监视列表中
+        if interval is not None and (isinstance(interval, bool) or not isinstance(interval, (int, float))
+                                     or interval <= 0):
+            raise ValueError(f'Interval must be a positive number of seconds: {interval!r}')
+        next_run = time.time() + random.uniform(0, interval or self.interval)
+        with self._cond:
+            self.targets[key] = target
+            self.next_runs[key] = next_run
+            if save:
+                self.save()
+            self._cond.notify()
+        return key
+
+    def remove(self, key: str) -> bool:
+        """移除目标，正在进行的同步不受影响。
+
+        :param str key: 目标标识
+        :return bool: 目标是否存在
+        """
+        with self._cond:
+            if self.targets.pop(key, None) is None:
+                return False
+            self.next_runs.pop(key, None)
+            self.passed.pop(key, None)
+            self.save()
+        return True
+
+    def sync_now(self, key: str) -> bool:
+        """将目标的下次同步时间提前到现在。
+
+        :param str key: 目标标识
+        :return bool: 目标是否存在
+        """
+        with self._cond:
+            if key not in self.targets:
+                return False
+            self.next_runs[key] = time.time()
+            self._cond.notify()
+        return True
+
+    def describe(self) -> list:
+        """返回所有目标及其同步状态。"""
+        with self._cond:
+            return [dict(key=key, target=target, next_run=datetime.fromtimestamp(self.next_runs[key]).isoformat(),
+                         **self.status.get(key, {}))
+                    for key, target in self.targets.items()]
+
+    def stop(self):
+        with self._cond:
+            self.stopped = True
+            self._cond.notify()
+
+    def next_target(self):
+        """等待到最早的同步时间，返回该目标的标识；停止时返回 None。"""
+        with self._cond:
+            while not self.stopped:
+                if self.next_runs:
+                    key = min(self.next_runs, key=self.next_runs.get)
+                    delay = self.next_runs[key] - time.time()
+                    if delay <= 0:
+                        return key
+                    self._cond.wait(delay)
+                else:
+                    self._cond.wait()
+        return None
+
+    def run_forever(self):
+        """依次同步到期的目标，直到 stop 被调用。"""
+        while True:
+            key = self.next_target()
+            if key is None:
+                break
+            self.sync(key)
+
+    def sync(self, key: str):
+        """同步一个目标，完成后按间隔安排下次同步。
+
+        :param str key: 目标标识
+        """
+        target = self.targets.get(key)
+        if target is None:
+            return
+        started = time.time()
+        self.echo(f'Syncing {key} ...', 'blue')
+        try:
+            result = self.sync_cnu(target) if target.get('cnu') else self.sync_zcool(key, target)
+        except Exception as e:
+            result = f'failed: {e}'
+            self.echo(f'Sync {key} {result}', 'red')
+        else:
+            self.echo(f'Synced {key}: {result}', 'green')
+
+        interval = target.get('interval') or self.interval
+        with self._cond:
+            self.status[key] = dict(last_run=datetime.fromtimestamp(started).isoformat(),
+                                    duration=round(time.time() - started, 1), result=result)
+            if key in self.targets:
+                self.next_runs[key] = time.time() + interval * random.uniform(1 - JITTER, 1 + JITTER)
+
+    def sync_zcool(self, key: str, target: dict) -> str:
+        """同步站酷用户或收藏集，已解析过的作品及已下载过的图片不再入队。
+
+        :return str: 同步结果
+        """
+        username = target.get('username')
+        # 常驻进程不写下载记录文件，以免每次同步都生成一个新文件
+        scraper = ZCoolScraper(user_id=target.get('id') or self.user_ids.get(username), username=username,
+                               collection=target.get('collection'), destination=self.destination,
+                               max_workers=self.max_workers, http2=self.http2, max_bandwidth=self.max_bandwidth,
+                               thumbnail=self.thumbnail, keep_records=False, verbose=False, autorun=False)
+        # 新作品发布后已有作品在主页中的位置会变化，已解析的作品按 URL 识别
+        passed = self.passed.setdefault(key, dict(topics_pass=TaskSet(key=lambda s: s.url),
+                                                  images_pass=TaskSet()))
+        scraper.stat.update(passed)
+        saved = len(passed['images_pass'])
+        try:
+            scraper.fetch_all(initialized=scraper.resolve())
+            scraper.run_scraper()
+        finally:
+            scraper.shutdown(wait=False)
+        failed = len(scraper.stat['images_fail'])
+        if failed:
+            # 下载失败的图片所属的作品未知，下次同步重新解析所有作品
+            passed['topics_pass'] = TaskSet(key=lambda s: s.url)
+        if username:
+            self.user_ids[username] = scraper.user_id
+        return f'{len(passed["images_pass"]) - saved} images synced, {failed} failed'
+
+    def sync_cnu(self, target: dict) -> str:
+        """同步 CNU URL，已完成的作品及图片请求不再发出。
+
+        :return str: 同步结果
+        """
+        from scraper.cnu import BASE_DIR, CNUSpider
+
+        storage = open_storage(self.destination)
+        self.fingerprints.reset()
+        # 每次同步使用新的事件循环，ruia 安装的信号处理随事件循环关闭而移除
+        loop = asyncio.new_event_loop()
+        try:
+            spider = loop.run_until_complete(CNUSpider.async_start(loop=loop, spider_config=dict(
+                start_urls=[target['cnu']],
+                _storage=storage.sub(BASE_DIR),
+                _thumbnail=self.thumbnail,
+                _limiter=TokenBucket(self.max_bandwidth * MB) if self.max_bandwidth else None,
+                _fingerprints=self.fingerprints
+            )))
+        finally:
+            loop.close()
+        return f'{spider.success_counts} requests, {spider.failed_counts} failed'
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """本地控制接口：
+
+    - GET /targets：列出目标及同步状态
+    - POST /targets：添加目标，请求体为 JSON，如 {"username": "alice", "interval": 3600}
+    - DELETE /targets/<key>：移除目标
+    - POST /targets/<key>/sync：立即同步
+    """
+
+    def reply(self, code, body):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def target(self):
+        """从路径 /targets/<key>[/sync] 中解析目标标识。"""
+        path = self.path.split('?')[0]
+        if not path.startswith('/targets/'):
+            return None
+        return unquote(path[len('/targets/'):]).rstrip('/')
+
+    def do_GET(self):
+        if self.path.split('?')[0].rstrip('/') != '/targets':
+            return self.reply(404, {'error': 'not found'})
+        self.reply(200, self.server.daemon.describe())
+
+    def do_POST(self):
+        key = self.target()
+        if key and key.endswith('/sync'):
+            if self.server.daemon.sync_now(key[:-len('/sync')]):
+                return self.reply(202, {'key': key[:-len('/sync')]})
+            return self.reply(404, {'error': 'unknown target'})
+        if self.path.split('?')[0].rstrip('/') != '/targets':
+            return self.reply(404, {'error': 'not found'})
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            key = self.server.daemon.add(json.loads(self.rfile.read(length)))
+        except (ValueError, TypeError, AttributeError) as e:
+            return self.reply(400, {'error': str(e)})
+        self.reply(201, {'key': key})
+
+    def do_DELETE(self):
+        key = self.target()
+        if key and self.server.daemon.remove(key):
+            return self.reply(200, {'key': key})
+        self.reply(404, {'error': 'unknown target'})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_control(daemon: Daemon, port: int = PORT):
+    """在后台线程中启动只监听 127.0.0.1 的控制接口。
+
+    :param Daemon daemon: 常驻进程
+    :param int port: 端口，0 表示随机端口
+    :return ThreadingHTTPServer: server，server.server_address 为实际监听的地址
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), ControlHandler)
+    server.daemon = daemon
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@click.command()
+@click.argument('watch_file', type=click.Path(dir_okay=False))
+@click.option('-d', '--destination', 'destination',
+              help='Destination to save images, a local path or s3://<bucket>/<prefix>.')
+@click.option('--interval', 'interval', default=INTERVAL, show_default=True, type=int,
+              help='Seconds between re-syncs of targets without their own interval.')
+@click.option('--port', 'port', default=PORT, show_default=True, type=int,
+              help='Port of the local control interface on 127.0.0.1.')
+@click.option('--max-workers', 'max_workers', default=MAX_WORKERS, show_default=True, type=int,
+              help='Maximum thread workers.')
+@click.option('--http2', 'http2', is_flag=True, default=False,
+              help='Share multiplexed HTTP/2 connections between workers (requires httpx[http2]).')
+@click.option('--max-bandwidth', 'max_bandwidth', type=float,
+              help='Maximum download bandwidth shared by all workers, in MB/s.')
+@click.option('--thumbnail', 'thumbnail', is_flag=True, default=False,
+              help='Download thumbnails instead of the original images.')
+def daemon_command(watch_file, destination, interval, port, max_workers, http2, max_bandwidth, thumbnail):
+    """Keep re-syncing the ZCool users, collections and CNU URLs in WATCH_FILE,
+    a JSON list such as [{"username": "alice", "interval": 3600}, {"cnu": "http://www.cnu.cc/users/142231"}].
+    """
+    try:
+        daemon = Daemon(watch_file, destination, interval, max_workers, http2, max_bandwidth, thumbnail)
+        server = serve_control(daemon, port)
+    except (OSError, ValueError) as e:
+        cprint(str(e), 'red')
+        sys.exit(1)
+    daemon.echo(f'Watching {len(daemon.targets)} targets, control interface on '
+                f'http://127.0.0.1:{server.server_address[1]}/targets')
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        daemon.echo('Stopped.', 'yellow')
+    finally:
+        server.shutdown()
+    return 0
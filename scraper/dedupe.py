@@ -0,0 +1,313 @@
+# @FILENAME : dedupe
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import os
+import os.path as op
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, List
+
+import click
+from termcolor import colored, cprint
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import PIL
+except ImportError:
+    PIL = None
+
+from scraper.utils import MB
+
+HASH_SIZE = 8  # 哈希为 HASH_SIZE * HASH_SIZE = 64 位
+DISTANCE = 4
+BATCH_SIZE = 10000
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
+
+
+def require_numpy():
+    if np is None or PIL is None:
+        raise ImportError('Near-duplicate detection requires numpy and Pillow, try "pip install numpy pillow".')
+
+
+def dhash(file, size: int = HASH_SIZE):
+    """计算图片的差异哈希（dHash）：缩放为 (size + 1) x size 的灰度图，逐行比较相邻像素的亮度。
+
+    重新压缩、缩放后的图片哈希值相同或只有少数位不同。
+
+    :param file: 图片路径或文件对象
+    :param int size: 哈希边长，哈希位数为 size * size
+    :return int: 哈希值，无法读取图片时返回 None
+    """
+    from PIL import Image
+    try:
+        with Image.open(file) as image:
+            image = image.convert('L').resize((size + 1, size), Image.LANCZOS)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    pixels = np.asarray(image, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hash_files(paths: List, workers: int = None):
+    """在进程池中计算图片的哈希值。
+
+    :param list paths: 图片路径
+    :param int workers: 进程数，默认 CPU 核数
+    :return Iterator[tuple]: (path, hash)，无法读取的图片 hash 为 None
+    """
+    require_numpy()
+    with ProcessPoolExecutor(workers) as pool:
+        yield from zip(paths, pool.map(dhash, paths, chunksize=64))
+
+
+def popcount(values):
+    """逐个计算 uint64 数组中 1 的位数。"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values)
+    return _POPCOUNT_TABLE[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+_POPCOUNT_TABLE = None if np is None else np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+class HashIndex(object):
+    """以 NumPy 数组保存的 64 位感知哈希索引，支持批量查询汉明距离不超过阈值的图片。
+
+    哈希被分为 ``max_distance + 1`` 段，距离不超过 max_distance 的两个哈希至少有一段完全相同（鸽巢原理）。
+    每段的值预先排序，查询时对整批哈希二分查找出候选，再向量化计算候选的汉明距离，无需两两比较。
+    """
+
+    def __init__(self, max_distance: int = DISTANCE, batch_size: int = BATCH_SIZE):
+        """
+        :param int max_distance: 视为近似重复的最大汉明距离，0 ~ 15
+        :param int batch_size: 每批查询的哈希数，限制候选数组的内存
+        """
+        require_numpy()
+        if not 0 <= max_distance < 16:
+            raise ValueError(f'Unsupported distance: {max_distance}')
+        self.max_distance = max_distance
+        self.batch_size = batch_size
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.paths = []
+        self._pending = []
+        self._bands = None
+        width = -(-HASH_SIZE ** 2 // (max_distance + 1))
+        self._shifts = list(range(0, HASH_SIZE ** 2, width))
+        self._mask = np.uint64((1 << width) - 1)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def add(self, path, value: int):
+        """添加一张图片。
+
+        :param str path: 图片路径
+        :param int value: 哈希值
+        """
+        self.paths.append(str(path))
+        self._pending.append(value)
+        self._bands = None
+
+    def _build(self):
+        if self._pending:
+            self.hashes = np.concatenate([self.hashes, np.array(self._pending, dtype=np.uint64)])
+            self._pending = []
+        if self._bands is None:
+            self._bands = []
+            for shift in self._shifts:
+                keys = (self.hashes >> np.uint64(shift)) & self._mask
+                order = np.argsort(keys, kind='stable')
+                self._bands.append((keys[order], order))
+
+    def query(self, values):
+        """查询与一批哈希距离不超过 max_distance 的图片。
+
+        :param values: 哈希值的数组
+        :return tuple: (查询序号, 索引序号, 距离) 三个数组，按查询序号、索引序号排序
+        """
+        self._build()
+        return self._query(np.asarray(values, dtype=np.uint64))
+
+    def duplicates(self):
+        """查找索引内所有近似重复的图片对。
+
+        :return tuple: (i, j, 距离) 三个数组，i < j
+        """
+        self._build()
+        return self._query(self.hashes, self_join=True)
+
+    def _query(self, values, self_join=False):
+        results = [[], [], []]
+        if self.hashes.size:
+            for start in range(0, len(values), self.batch_size):
+                batch = self._query_batch(values[start:start + self.batch_size], start if self_join else None)
+                for i, result in enumerate(batch):
+                    results[i].append(result + start if i == 0 else result)
+        if not results[0]:
+            return tuple(np.empty(0, dtype=np.int64) for _ in range(3))
+        queries, candidates, distances = (np.concatenate(result) for result in results)
+        order = np.lexsort((candidates, queries))
+        return queries[order], candidates[order], distances[order]
+
+    def _query_batch(self, values, start=None):
+        results = [[], [], []]
+        for band, (shift, (keys, order)) in enumerate(zip(self._shifts, self._bands)):
+            key = (values >> np.uint64(shift)) & self._mask
+            left = np.searchsorted(keys, key, 'left')
+            counts = np.searchsorted(keys, key, 'right') - left
+            # 将每个查询的候选区间 [left, left + count) 展开为一维数组
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            queries = np.repeat(np.arange(len(values)), counts)
+            candidates = order[np.repeat(left, counts) + offsets]
+            if start is not None:
+                # 索引自身的查询只保留 i < j 的图片对
+                keep = candidates > queries + start
+                queries, candidates = queries[keep], candidates[keep]
+            xor = values[queries] ^ self.hashes[candidates]
+            distances = popcount(xor)
+            keep = distances <= self.max_distance
+            # 在之前的段中已经完全相同的候选已被统计过，不重复产出
+            for prev in self._shifts[:band]:
+                keep &= ((xor >> np.uint64(prev)) & self._mask) != 0
+            for i, result in enumerate((queries, candidates, distances)):
+                results[i].append(result[keep].astype(np.int64))
+        return tuple(np.concatenate(result) for result in results)
+
+    def groups(self) -> List[List[str]]:
+        """将近似重复的图片合并为组，同一组内的图片直接或间接近似重复。
+
+        :return list: 每组图片的路径，按路径排序
+        """
+        parent = {}
+
+        def find(x):
+            parent.setdefault(x, x)
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        # 并查集只遍历近似重复的图片对，而不是所有图片
+        for i, j in zip(*self.duplicates()[:2]):
+            root_i, root_j = find(int(i)), find(int(j))
+            if root_i != root_j:
+                parent[max(root_i, root_j)] = min(root_i, root_j)
+        groups = {}
+        for x in list(parent):
+            groups.setdefault(find(x), []).append(self.paths[x])
+        return sorted(sorted(paths) for paths in groups.values())
+
+    def save(self, file):
+        """保存索引到 .npz 文件。
+
+        :param str file: 文件路径
+        """
+        self._build()
+        # 传入文件对象，以免 numpy 给文件名加上 .npz 后缀
+        with open(file, 'wb') as f:
+            np.savez(f, hashes=self.hashes, paths=np.array(self.paths, dtype=str))
+
+    def load(self, file):
+        """从 .npz 文件读取索引，追加到当前索引中。
+
+        :param str file: 文件路径
+        """
+        with np.load(file) as data:
+            self.paths.extend(data['paths'].tolist())
+            self._pending.extend(data['hashes'].tolist())
+        self._bands = None
+
+
+def find_images(directories: Iterable) -> List[str]:
+    """递归查找目录中的图片文件。
+
+    :param Iterable directories: 目录
+    :return list: 图片路径
+    """
+    return sorted(str(path) for directory in directories for path in Path(directory).rglob('*')
+                  if path.suffix.lower() in IMAGE_EXTENSIONS and path.is_file())
+
+
+def hardlink_group(paths: List[str], hashes: dict, max_distance: int = DISTANCE) -> int:
+    """将组内扩展名相同的图片替换为指向其中最大文件的硬链接。
+
+    组是传递合并的，组内两张图片的距离可能超过 max_distance，只替换与保留的文件距离不超过
+    max_distance 的图片；扩展名不同的图片格式不同，不会互相替换。
+
+    :param list paths: 同一组图片的路径
+    :param dict hashes: 图片路径到哈希值的映射
+    :param int max_distance: 视为近似重复的最大汉明距离
+    :return int: 节省的字节数
+    """
+    formats = {}
+    for path in paths:
+        ext = op.splitext(path)[1].lower().replace('.jpeg', '.jpg')
+        formats.setdefault(ext, []).append(path)
+
+    saved = 0
+    for same_format in formats.values():
+        keep = max(same_format, key=lambda p: (os.path.getsize(p), p))
+        for path in same_format:
+            if path == keep or os.path.samefile(path, keep):
+                continue
+            if bin(hashes[path] ^ hashes[keep]).count('1') > max_distance:
+                continue
+            size = os.path.getsize(path)
+            tmp = f'{path}.link'
+            os.link(keep, tmp)
+            os.replace(tmp, path)
+            saved += size
+    return saved
+
+
+@click.command()
+@click.argument('directories', nargs=-1, required=True, type=click.Path(exists=True, file_okay=False))
+@click.option('-D', '--distance', default=DISTANCE, show_default=True, type=click.IntRange(0, 15),
+              help='Maximum Hamming distance between the hashes of near-duplicate images.')
+@click.option('--index', 'index_file', type=click.Path(dir_okay=False),
+              help='Hash index (.npz) to reuse and update, only new images are hashed.')
+@click.option('--hardlink', is_flag=True,
+              help='Replace near-duplicates of the same format with hard links to the largest copy.')
+@click.option('--workers', type=int, help='Number of hashing processes, defaults to the number of CPUs.')
+def dedupe_command(directories, distance, index_file, hardlink, workers):
+    """Find near-duplicate images in downloaded directories by perceptual hash."""
+    try:
+        index = HashIndex(distance)
+    except ImportError as e:
+        cprint(str(e), 'red')
+        sys.exit(1)
+    if index_file and op.isfile(index_file):
+        index.load(index_file)
+
+    known = set(index.paths)
+    paths = [path for path in find_images(directories) if path not in known]
+    for path, value in hash_files(paths, workers):
+        if value is not None:
+            index.add(path, value)
+    if index_file:
+        index.save(index_file)
+    cprint(f'Hashed {len(paths)} new images, {len(index)} images in index.', 'blue')
+
+    groups = [[p for p in group if op.isfile(p)] for group in index.groups()]
+    groups = [group for group in groups if len(group) > 1]
+    if not groups:
+        cprint('No near-duplicate images found.', 'green')
+        return 0
+
+    hashes = dict(zip(index.paths, index.hashes.tolist()))
+    saved = 0
+    for group in groups:
+        print('\n'.join([colored(group[0], 'yellow')] + [f'  {path}' for path in group[1:]]))
+        if hardlink:
+            saved += hardlink_group(group, hashes, distance)
+    cprint(f'Found {len(groups)} groups of near-duplicate images '
+           f'({sum(len(group) for group in groups)} files).', 'green')
+    if hardlink:
+        cprint(f'Hard linked duplicates, saved {saved / MB:.1f} MB.', 'green')
+    return 0
@@ -0,0 +1,181 @@
+# @FILENAME : records
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import json
+import threading
+from datetime import datetime
+from pathlib import Path
+from queue import Empty, Queue
+
+from scraper.utils import mkdirs_if_not_exist
+
+METADATA_FIELDS = ('author', 'title', 'objid', 'index', 'url')
+METADATA_FORMATS = ('jsonl', 'parquet')
+
+
+class MetadataWriter(object):
+    """线程安全地逐条写出图片元数据，支持 JSON Lines 及 Parquet（需安装 pyarrow）。
+
+    文件在写入第一条记录时才创建；Parquet 每 ``batch_size`` 条记录写出一个 row group。
+    """
+
+    def __init__(self, path, fmt: str = 'jsonl', batch_size: int = 1000):
+        """
+        :param str path: 输出文件路径
+        :param str fmt: 输出格式，jsonl 或 parquet
+        :param int batch_size: Parquet 每个 row group 的记录数
+        """
+        if fmt not in METADATA_FORMATS:
+            raise ValueError(f'Unsupported metadata format: {fmt}')
+        if fmt == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError('Parquet output requires pyarrow, try "pip install pyarrow".')
+        self.path = Path(path)
+        self.fmt = fmt
+        self.batch_size = batch_size
+        self.count = 0
+        self._file = None
+        self._batch = []
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open(self):
+        mkdirs_if_not_exist(self.path.parent)
+        if self.fmt == 'jsonl':
+            self._file = open(self.path, 'w', encoding='utf-8')
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            schema = pa.schema([(field, pa.int64() if field == 'index' else pa.string())
+                                for field in METADATA_FIELDS])
+            self._file = pq.ParquetWriter(str(self.path), schema)
+
+    def _flush_batch(self):
+        import pyarrow as pa
+        columns = {field: [record.get(field) for record in self._batch] for field in METADATA_FIELDS}
+        columns['objid'] = [None if objid is None else str(objid) for objid in columns['objid']]
+        self._file.write_table(pa.Table.from_pydict(columns, schema=self._file.schema))
+        self._batch = []
+
+    def write(self, record: dict):
+        """写出一条记录，只保留 METADATA_FIELDS 中的字段。
+
+        :param dict record: 元数据记录
+        """
+        with self._lock:
+            if self._file is None:
+                self._open()
+            if self.fmt == 'jsonl':
+                self._file.write(json.dumps({field: record.get(field) for field in METADATA_FIELDS},
+                                            ensure_ascii=False) + '\n')
+            else:
+                self._batch.append(record)
+                if len(self._batch) >= self.batch_size:
+                    self._flush_batch()
+            self.count += 1
+
+    def close(self):
+        """写出剩余记录并关闭文件。"""
+        with self._lock:
+            if self._file is None:
+                return
+            if self._batch:
+                self._flush_batch()
+            self._file.close()
+            self._file = None
+
+
+class RecordWriter(object):
+    """在后台线程中将下载记录以 JSON Lines 格式追加到文件。
+
+    首行为 ``{"time": 开始时间}``，之后每行一条记录，``status`` 为 success 或 fail。
+    记录每隔 ``flush_interval`` 秒写入磁盘，运行中断时已写入的记录不会丢失。
+    """
+
+    def __init__(self, path, start_time: datetime, flush_interval: float = 1.0):
+        """
+        :param str path: 记录文件路径，写入第一条记录时才创建
+        :param datetime start_time: 开始时间
+        :param float flush_interval: 写入磁盘的间隔，秒
+        """
+        self.path = Path(path)
+        self.start_time = start_time
+        self.flush_interval = flush_interval
+        self._queue = Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def write(self, status: str, scrapy):
+        """追加一条记录。
+
+        :param str status: success 或 fail
+        :param Scrapy scrapy: 记录任务信息的数据体
+        """
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True)
+                    self._thread.start()
+        self._queue.put(dict(status=status, **scrapy._asdict()))
+
+    def _run(self):
+        mkdirs_if_not_exist(self.path.parent)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'time': self.start_time.isoformat()}) + '\n')
+            closed = False
+            while not closed:
+                try:
+                    batch = [self._queue.get(timeout=self.flush_interval)]
+                except Empty:
+                    continue
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except Empty:
+                        break
+                if batch[-1] is None:
+                    batch.pop()
+                    closed = True
+                f.writelines(json.dumps(record, ensure_ascii=False) + '\n' for record in batch)
+                f.flush()
+
+    def close(self):
+        """写入剩余记录并结束后台线程。
+
+        :return Path: 记录文件路径，没有任何记录时为 None
+        """
+        if self._thread is None:
+            return None
+        self._queue.put(None)
+        self._thread.join()
+        return self.path
+
+
+def load_failed_records(file):
+    """逐行读取 JSON Lines 格式的下载记录，返回最终仍失败的记录。
+
+    同一任务先失败后成功时不再视为失败。
+
+    :param str file: 记录文件路径
+    :return list: 失败记录的 dict，不含 status 字段
+    """
+    failed = {}
+    with open(file, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            status = record.pop('status', None)
+            if status is None:
+                continue
+            key = tuple(record.values())
+            if status == 'fail':
+                failed[key] = record
+            else:
+                failed.pop(key, None)
+    return list(failed.values())
@@ -0,0 +1,171 @@
+# @FILENAME : storage
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import os
+from pathlib import Path
+from typing import Iterable
+
+from scraper.utils import MB, mkdirs_if_not_exist
+
+S3_SCHEME = 's3://'
+PART_SIZE = 8 * MB
+
+
+class Storage(object):
+    """存储后端接口，路径均为相对于存储根目录、以 / 分隔的路径。"""
+
+    def sub(self, *parts) -> 'Storage':
+        """返回以 <根目录>/<parts> 为根目录的存储。"""
+        raise NotImplementedError
+
+    def exists(self, path: str) -> bool:
+        """文件是否已存在。
+
+        :param str path: 文件路径
+        """
+        raise NotImplementedError
+
+    def write(self, path: str, chunks: Iterable[bytes], size: int = None):
+        """写入文件，已存在时覆盖。
+
+        :param str path: 文件路径
+        :param Iterable[bytes] chunks: 文件内容块，可以是 memoryview，写入后即可被覆盖
+        :param int size: 预计的文件大小，未知时为 None
+        """
+        raise NotImplementedError
+
+
+class LocalStorage(Storage):
+    """本地文件系统。"""
+
+    def __init__(self, root='.'):
+        """
+        :param str root: 根目录
+        """
+        self.root = Path(root)
+
+    def __repr__(self):
+        return str(self.root.absolute())
+
+    def sub(self, *parts):
+        return LocalStorage(self.root.joinpath(*parts))
+
+    def exists(self, path):
+        return (self.root / path).is_file()
+
+    def write(self, path, chunks, size=None):
+        filename = self.root / path
+        mkdirs_if_not_exist(filename.parent)
+        # 先写入同目录下的临时文件，完整写入后再替换，下载中断时不会留下不完整的文件
+        tmp = filename.with_name(f'{filename.name}.part')
+        try:
+            with open(tmp, 'wb') as f:
+                if size and hasattr(os, 'posix_fallocate'):
+                    # 按 Content-Length 预先分配磁盘空间，减少碎片；文件系统不支持时忽略
+                    try:
+                        os.posix_fallocate(f.fileno(), 0, size)
+                    except OSError:
+                        pass
+                for chunk in chunks:
+                    f.write(chunk)
+                # 实际内容比预分配的少时截去多余部分
+                f.truncate()
+            os.replace(tmp, filename)
+        except BaseException:
+            if tmp.is_file():
+                tmp.unlink()
+            raise
+
+
+class S3Storage(Storage):
+    """S3 兼容的对象存储（需安装 boto3）。
+
+    小于 ``part_size`` 的文件使用一次 PutObject 上传，其余文件边读取边分段上传（multipart upload），
+    内存中最多缓存一个分段。MinIO 等服务可通过环境变量 AWS_ENDPOINT_URL 指定地址。
+    """
+
+    def __init__(self, bucket: str, prefix: str = '', client=None, part_size: int = PART_SIZE):
+        """
+        :param str bucket: 存储桶
+        :param str prefix: 对象键的前缀，相当于根目录
+        :param client: boto3 的 S3 client，默认使用 boto3.client('s3')
+        :param int part_size: 分段大小，不能小于 5 MB
+        """
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImportError('S3 storage requires boto3, try "pip install boto3".')
+            client = boto3.client('s3')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client
+        self.part_size = part_size
+
+    def __repr__(self):
+        return f'{S3_SCHEME}{self.bucket}/{self.prefix}'
+
+    def key(self, path):
+        return f'{self.prefix}/{path}' if self.prefix else path
+
+    def sub(self, *parts):
+        prefix = '/'.join(p.strip('/') for p in (self.prefix, *map(str, parts)) if p)
+        return S3Storage(self.bucket, prefix, self.client, self.part_size)
+
+    def exists(self, path):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(path))
+        except self.client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def _upload_part(self, key, upload_id, buffer, parts):
+        part_number = len(parts) + 1
+        resp = self.client.upload_part(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                       PartNumber=part_number, Body=bytes(buffer))
+        parts.append({'ETag': resp['ETag'], 'PartNumber': part_number})
+
+    def write(self, path, chunks, size=None):
+        key = self.key(path)
+        buffer = bytearray()
+        upload_id = None
+        parts = []
+        try:
+            for chunk in chunks:
+                buffer += chunk
+                if len(buffer) >= self.part_size:
+                    if upload_id is None:
+                        upload_id = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)['UploadId']
+                    self._upload_part(key, upload_id, buffer, parts)
+                    buffer = bytearray()
+
+            if upload_id is None:
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=bytes(buffer))
+                return
+            if buffer:
+                self._upload_part(key, upload_id, buffer, parts)
+            self.client.complete_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                                  MultipartUpload={'Parts': parts})
+        except Exception:
+            if upload_id is not None:
+                self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=upload_id)
+            raise
+
+
+def is_remote(destination) -> bool:
+    """保存路径是否为对象存储的 URI。"""
+    return str(destination or '').startswith(S3_SCHEME)
+
+
+def open_storage(destination=None) -> Storage:
+    """根据保存路径创建存储后端：s3://<bucket>/<prefix> 为 S3 兼容的对象存储，其余为本地路径。
+
+    :param str destination: 保存路径，默认当前路径
+    :return Storage: 存储后端
+    """
+    if is_remote(destination):
+        bucket, _, prefix = str(destination)[len(S3_SCHEME):].partition('/')
+        return S3Storage(bucket, prefix)
+    return LocalStorage(destination or '.')
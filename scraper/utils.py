@@ -1,12 +1,24 @@
 # @FILENAME : utils
 # @AUTHOR : lonsty
 # @DATE : 2019/9/9 11:09
+import asyncio
+import hashlib
 import os
 import random
+import socket
+import sys
+import threading
 import time
+from array import array
 from collections import namedtuple
 from functools import wraps
-from typing import Iterable
+from heapq import heappop, heappush
+from pathlib import Path
+from queue import Queue
+from typing import Callable, Iterable
+from urllib.parse import urlsplit
+
+MB = 1024 * 1024
 
 
 def retry(exceptions, tries=3, delay=1, backoff=2, logger=None):
@@ -64,6 +76,11 @@ def safe_filename(filename):
     return "".join([c for c in filename if c not in r'\/:*?"<>|']).strip()
 
 
+def intern(value):
+    """驻留字符串，使相同的作者、标题等只保留一份；其他类型的值原样返回。"""
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 def parse_resources(ids, names, collections):
     """解析用户名或 ID。
 
@@ -96,3 +113,255 @@ def sort_records(records: Iterable, order: dict):
         return (order[obj.type], obj.objid, obj.index, obj.title, obj.url)
 
     return sorted(records, key=_order_by)
+
+
+class DNSCache(object):
+    """域名解析结果的缓存，避免每个新连接都重新解析域名。
+
+    只由使用它的连接调用，不替换进程全局的 socket.getaddrinfo；过期的结果在写入时清理，
+    缓存满时丢弃最早写入的结果，在常驻进程中也不会无限增长。
+    """
+
+    def __init__(self, ttl: float = 300, maxsize: int = 1024):
+        """
+        :param float ttl: 解析结果的缓存时间，秒
+        :param int maxsize: 最多缓存的 (host, port, family) 数
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def resolve(self, host: str, port: int, family: int = 0) -> list:
+        """返回域名解析出的所有地址，顺序与 getaddrinfo 相同，由调用方依次尝试连接。
+
+        :param str host: 域名
+        :param int port: 端口
+        :param int family: 地址族，0 表示不限
+        :return list: IP 地址
+        """
+        key = (host, port, family)
+        now = time.monotonic()
+        with self._lock:
+            hit = self._cache.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+        infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        with self._lock:
+            if len(self._cache) >= self.maxsize:
+                for k in [k for k, (expires, _) in self._cache.items() if expires <= now]:
+                    del self._cache[k]
+                while len(self._cache) >= self.maxsize:
+                    del self._cache[next(iter(self._cache))]
+            self._cache.pop(key, None)
+            self._cache[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def invalidate(self, host: str, port: int, family: int = 0):
+        """丢弃解析结果，如所有地址都无法连接时，下次重新解析。"""
+        with self._lock:
+            self._cache.pop((host, port, family), None)
+
+
+class TokenBucket(object):
+    """令牌桶限速器，可在多个线程或协程间共享。
+
+    桶满时允许突发 ``capacity`` 字节，之后按 ``rate`` 字节/秒的速率补充令牌。
+    令牌不足时记为欠账，调用方按欠账时长等待，以维持稳定的平均速率。
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param float rate: 每秒补充的令牌数（字节）
+        :param float capacity: 桶容量，即允许突发的字节数，默认 1 秒的流量
+        """
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._timestamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount):
+        """取出令牌，返回需要等待的秒数。
+
+        :param int amount: 令牌数（字节）
+        :return float: 等待时间，秒
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._timestamp) * self.rate)
+            self._timestamp = now
+            self._tokens -= amount
+            return -self._tokens / self.rate if self._tokens < 0 else 0
+
+    def consume(self, amount):
+        """取出令牌，令牌不足时阻塞当前线程。
+
+        :param int amount: 令牌数（字节）
+        """
+        delay = self.reserve(amount)
+        if delay:
+            time.sleep(delay)
+
+    async def consume_async(self, amount):
+        """取出令牌，令牌不足时挂起当前协程。
+
+        :param int amount: 令牌数（字节）
+        """
+        delay = self.reserve(amount)
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class PriorityTaskQueue(Queue):
+    """按优先级出队的任务队列，``key`` 越小越先出队，优先级相同时先进先出。
+
+    堆中每个任务只保存一个整数 ``key(item) << 32 | 序号``，任务本身按序号存放在列表中，
+    比保存 (优先级, 序号, 任务) 元组节省内存；队列取空时列表随之清空。
+    """
+
+    def __init__(self, key: Callable, maxsize: int = 0):
+        """
+        :param Callable key: 根据任务计算优先级的函数，返回非负整数
+        :param int maxsize: 队列最大长度，默认不限制
+        """
+        self.key = key
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self.queue = []
+        self._items = []
+
+    def _qsize(self):
+        return len(self.queue)
+
+    def _put(self, item):
+        heappush(self.queue, self.key(item) << 32 | len(self._items))
+        self._items.append(item)
+
+    def _get(self):
+        seq = heappop(self.queue) & 0xFFFFFFFF
+        item, self._items[seq] = self._items[seq], None
+        if not self.queue:
+            self._items = []
+        return item
+
+
+class TaskSet(object):
+    """只保存任务哈希值的集合，支持 add、in 及 len。
+
+    集合不持有任务本身，任务完成后即可被回收；每个任务约占 60 字节，而不是整个任务的元组及字符串。
+    哈希值为 64 位，百万级任务中出现冲突的概率可以忽略。
+    """
+
+    def __init__(self, tasks: Iterable = (), key: Callable = None):
+        """
+        :param Iterable tasks: 初始任务
+        :param Callable key: 计算哈希前从任务中取出标识的函数，默认对整个任务计算哈希
+        """
+        self._key = key
+        self._hashes = {self._hash(task) for task in tasks}
+
+    def _hash(self, task):
+        return hash(self._key(task) if self._key else task)
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def __contains__(self, task):
+        return self._hash(task) in self._hashes
+
+    def add(self, task):
+        self._hashes.add(self._hash(task))
+
+
+class Fingerprints(object):
+    """请求指纹集合，用于在请求进入队列前去除重复的请求。
+
+    每个请求只保存其 URL（忽略协议、片段及末尾的 /）的 64 位哈希值，而不是 URL 字符串本身。
+    指定 ``path`` 时，通过 ``persist`` 标记的指纹以 8 字节整数追加到文件，下次运行时读入，
+    已完成的请求在之后的运行中也不会再发出。
+    """
+
+    def __init__(self, path=None):
+        """
+        :param str path: 持久化文件路径，默认不持久化
+        """
+        self.path = Path(path) if path else None
+        self._seen = set()
+        # 本次运行中只记录在内存中、尚未持久化的指纹
+        self._transient = set()
+        self._file = None
+        if self.path and self.path.is_file():
+            fingerprints = array('Q')
+            with open(self.path, 'rb') as f:
+                fingerprints.frombytes(f.read())
+            self._seen.update(fingerprints)
+        self.loaded = len(self._seen)
+
+    def __len__(self):
+        return len(self._seen)
+
+    def __contains__(self, url):
+        return self.fingerprint(url) in self._seen
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def fingerprint(url: str) -> int:
+        """计算 URL 的 64 位指纹。
+
+        :param str url: 请求 URL
+        :return int: 指纹
+        """
+        parts = urlsplit(url)
+        key = f'{parts.netloc.lower()}{parts.path.rstrip("/")}?{parts.query}'
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+    def add(self, url: str) -> bool:
+        """记录请求，返回是否为新的请求。
+
+        :param str url: 请求 URL
+        :return bool: 此前未记录过时为 True
+        """
+        fingerprint = self.fingerprint(url)
+        if fingerprint in self._seen:
+            return False
+        self._seen.add(fingerprint)
+        self._transient.add(fingerprint)
+        return True
+
+    def persist(self, url: str):
+        """记录请求并写入持久化文件，未指定文件时只记录在内存中。
+
+        :param str url: 已完成的请求 URL
+        """
+        fingerprint = self.fingerprint(url)
+        self._seen.add(fingerprint)
+        self._transient.discard(fingerprint)
+        if self.path is None:
+            return
+        if self._file is None:
+            mkdirs_if_not_exist(self.path.parent)
+            self._file = open(self.path, 'ab')
+        self._file.write(array('Q', [fingerprint]).tobytes())
+        self._file.flush()
+
+    def reset(self):
+        """清除本次运行中只通过 add 记录的指纹，保留已完成的请求，以便在同一进程中再次运行。"""
+        self._seen -= self._transient
+        self._transient = set()
+
+    def close(self):
+        """关闭持久化文件。"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -1,5 +1,7 @@
 # @AUTHOR: lonsty
 # @DATE:   2019-09-07 18:34:18
+import base64
+import binascii
 import json
 import math
 import os.path as op
@@ -7,11 +9,13 @@ import re
 import sys
 import threading
 import time
-from collections import namedtuple
-from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from collections import Counter, namedtuple
+from concurrent.futures import (FIRST_COMPLETED, ThreadPoolExecutor,
+                                as_completed, wait)
 from datetime import datetime
+from itertools import count
 from pathlib import Path
-from queue import Empty, Queue
+from queue import Empty
 from typing import List
 from urllib.parse import urljoin, urlparse
 from uuid import uuid4
@@ -19,10 +23,25 @@ from uuid import uuid4
 import click
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
 from termcolor import colored, cprint
-
-from scraper.utils import (mkdirs_if_not_exist, parse_resources, retry,
-                           safe_filename, sort_records)
+from urllib3 import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+try:
+    import httpx
+except ImportError:  # HTTP/2 为可选功能，需要安装 httpx[http2]
+    httpx = None
+
+from scraper.archive import ARCHIVE_FORMATS, SHARD_SIZE, ShardedArchive
+from scraper.records import (METADATA_FORMATS, MetadataWriter, RecordWriter,
+                             load_failed_records)
+from scraper.storage import LocalStorage, Storage, is_remote, open_storage
+from scraper.utils import (MB, DNSCache, PriorityTaskQueue, TaskSet,
+                           TokenBucket, intern, parse_resources, retry,
+                           safe_filename)
 
 Scrapy = namedtuple('Scrapy', 'type author title objid index url')  # 用于记录下载任务
 HEADERS = {
@@ -39,76 +58,436 @@ USER_API = 'https://www.zcool.com.cn/member/card/{id}'
 TIMEOUT = 30
 Q_TIMEOUT = 1
 MAX_WORKERS = 20
+PAGE_WORKERS = 4
+TOPIC_WORKERS = 8
 RETRIES = 3
+HTTP2 = False
+CHUNK_SIZE = 8192
+BUFFER_SIZE = 1024 * 1024  # 下载图片时每次读取、写入的块大小
+POOL_HOSTS = 10
+DNS_TTL = 300
+
+transport_lock = threading.Lock()
+transport = {'session': None, 'options': None}
+transport_stats = Counter()
+transport_stats_lock = threading.Lock()
+dns_cache = DNSCache(DNS_TTL)
+thread_buffers = threading.local()
+
+
+def count_transport(key: str):
+    """在多个线程中累加连接复用统计。
+
+    :param str key: requests 或 connections
+    """
+    with transport_stats_lock:
+        transport_stats[key] += 1
+
+
+class CachedDNSMixin(object):
+    """建立连接时使用 dns_cache 中的解析结果，与 urllib3 一样依次尝试每个地址。
+
+    TLS 的 SNI 及证书校验仍使用原域名。
+    """
+
+    def _new_conn(self):
+        host = self._dns_host
+        family = allowed_gai_family()
+        try:
+            addresses = dns_cache.resolve(host, self.port, family)
+        except OSError:
+            # 解析失败时交给 urllib3 重新解析，由它抛出 NameResolutionError
+            return super()._new_conn()
+        error = None
+        try:
+            for address in addresses:
+                self._dns_host = address
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+        finally:
+            self._dns_host = host
+        # 所有地址都无法连接，下次重新解析
+        dns_cache.invalidate(host, self.port, family)
+        raise error
+
+
+class CachedDNSHTTPConnection(CachedDNSMixin, HTTPConnection):
+    pass
+
+
+class CachedDNSHTTPSConnection(CachedDNSMixin, HTTPSConnection):
+    pass
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """统计新建连接数的连接池。"""
+
+    ConnectionCls = CachedDNSHTTPConnection
+
+    def _new_conn(self):
+        count_transport('connections')
+        return super()._new_conn()
 
-thread_local = threading.local()
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """统计新建连接数的 HTTPS 连接池。"""
+
+    ConnectionCls = CachedDNSHTTPSConnection
+
+    def _new_conn(self):
+        count_transport('connections')
+        return super()._new_conn()
+
+
+class PooledAdapter(HTTPAdapter):
+    """统计请求数及新建连接数的 HTTPAdapter，新建连接时使用缓存的域名解析结果。"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': CountingHTTPConnectionPool,
+            'https': CountingHTTPSConnectionPool
+        }
+
+    def send(self, request, **kwargs):
+        count_transport('requests')
+        return super().send(request, **kwargs)
+
+
+def configure_transport(max_workers: int = MAX_WORKERS, http2: bool = False):
+    """创建进程内所有线程共享的 Session，单个主机的连接池大小与线程数一致。
+
+    参数未变化时保留已有的连接池，以复用已建立的连接。参数变化时之后的请求使用新的 Session，
+    旧的 Session 不会被关闭，其他仍在使用它的爬虫或 download 调用中进行的请求不受影响，
+    旧连接在 Session 不再被引用后随之释放。
+
+    :param int max_workers: 线程数，决定每个主机的最大连接数
+    :param bool http2: 是否使用 HTTP/2 多路复用连接（需安装 httpx[http2]）
+    :return requests.Session | httpx.Client: session
+    """
+    global HTTP2
+    with transport_lock:
+        options = (max_workers, http2)
+        if transport['options'] == options:
+            return transport['session']
+
+        # HTTP/2 只建立少量长连接，不需要缓存域名解析结果
+        if http2:
+            def count_request(request):
+                count_transport('requests')
+
+            session = httpx.Client(
+                http2=True, follow_redirects=True,
+                limits=httpx.Limits(max_connections=max_workers * POOL_HOSTS,
+                                    max_keepalive_connections=max_workers),
+                event_hooks={'request': [count_request]})
+        else:
+            session = requests.Session()
+            adapter = PooledAdapter(pool_connections=POOL_HOSTS, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        HTTP2 = http2
+        transport.update(session=session, options=options)
+        return session
 
 
 def get_session():
-    """使线程获取同一个 Session，可减少 TCP 连接数，加速请求。
+    """获取所有线程共享的 Session，可减少 TCP 连接数，加速请求。
+
+    :return requests.Session | httpx.Client: session
+    """
+    return transport['session'] or configure_transport(http2=HTTP2)
+
+
+def get_transport_stats() -> dict:
+    """获取连接复用统计。HTTP/2 模式下无法统计新建连接数。
 
-    :return requests.Session: session
+    :return dict: 请求数、新建连接数、复用连接的请求数
     """
-    if not hasattr(thread_local, "session"):
-        thread_local.session = requests.Session()
-    return thread_local.session
+    requests_, connections = transport_stats['requests'], transport_stats['connections']
+    return {
+        'requests': requests_,
+        'connections': connections,
+        'reused': max(requests_ - connections, 0) if not HTTP2 else None
+    }
+
+
+def iter_content(resp, chunk_size: int = CHUNK_SIZE):
+    """按块迭代响应内容，兼容 requests 与 httpx 的响应对象。
+
+    :param resp: requests.Response 或 httpx.Response
+    :param int chunk_size: 块大小
+    :return Iterator[bytes]: 响应内容块
+    """
+    if hasattr(resp, 'iter_content'):
+        return resp.iter_content(chunk_size)
+    return resp.iter_bytes(chunk_size)
+
+
+def thread_buffer(size: int = BUFFER_SIZE) -> memoryview:
+    """返回当前线程复用的缓冲区，避免每次下载都重新分配。
+
+    :param int size: 缓冲区大小
+    :return memoryview: 缓冲区
+    """
+    buffer = getattr(thread_buffers, 'buffer', None)
+    if buffer is None or len(buffer) != size:
+        buffer = thread_buffers.buffer = memoryview(bytearray(size))
+    return buffer
+
+
+def iter_blocks(resp, buffer: memoryview = None, block_size: int = BUFFER_SIZE):
+    """以大块读取响应内容，每块读满后才产出，减少循环次数、内存分配及写入的系统调用。
+
+    requests 的响应通过 raw.readinto 直接读入缓冲区；给定 buffer 时复用该缓冲区，
+    产出的 memoryview 在下一次迭代时被覆盖，否则每块使用新的缓冲区。
+    其他响应（如 httpx）退回到 iter_content。
+
+    :param resp: requests.Response 或 httpx.Response
+    :param memoryview buffer: 复用的缓冲区
+    :param int block_size: 未给定 buffer 时每块的大小
+    :return Iterator[memoryview | bytes]: 响应内容块
+    """
+    raw = getattr(resp, 'raw', None)
+    if not hasattr(raw, 'readinto'):
+        yield from iter_content(resp, len(buffer) if buffer is not None else block_size)
+        return
+    raw.decode_content = True
+    while True:
+        view = buffer if buffer is not None else memoryview(bytearray(block_size))
+        filled = 0
+        while filled < len(view):
+            n = raw.readinto(view[filled:])
+            if not n:
+                break
+            filled += n
+        if filled:
+            yield view[:filled]
+        if filled < len(view):
+            return
 
 
 @retry(Exception, tries=RETRIES)
-def session_request(url: str, method: str = 'GET') -> requests.Response:
+def session_request(url: str, method: str = 'GET', stream: bool = False) -> requests.Response:
     """使用 session 请求数据。使用了装饰器 retry，在网络异常导致错误时会重试。
 
     :param str url: 目标请求 URL
     :param str method: 请求方式
-    :return requests.Response: 响应数据
+    :param bool stream: 是否流式读取响应内容，为 True 时需由调用方关闭响应
+    :return requests.Response | httpx.Response: 响应数据
     """
-    resp = get_session().request(method, url, headers=HEADERS, timeout=TIMEOUT)
-    resp.raise_for_status()
+    session = get_session()
+    if httpx is not None and isinstance(session, httpx.Client):
+        request = session.build_request(method, url, headers=HEADERS, timeout=TIMEOUT)
+        resp = session.send(request, stream=stream)
+    else:
+        resp = session.request(method, url, headers=HEADERS, timeout=TIMEOUT, stream=stream)
+    try:
+        resp.raise_for_status()
+    except Exception:
+        resp.close()
+        raise
     return resp
 
 
+class ZCoolError(Exception):
+    """无法解析用户、收藏集或连接失败等导致抓取无法进行时抛出。"""
+
+
+def decode_objid(url: str):
+    """从作品 URL 中解析 objid，无需请求作品页面。
+
+    站酷作品 URL 形如 https://www.zcool.com.cn/work/ZNDU2NjE2NTI=.html，
+    其中 Z 之后为 objid 的 Base64 编码。
+
+    :param str url: 作品 URL
+    :return str: objid，无法解析时返回 None
+    """
+    match = re.search(r'/work/Z([\w+/-]+=*)\.html', url or '')
+    if not match:
+        return None
+    try:
+        objid = base64.b64decode(match.group(1), altchars=b'-_').decode('ascii')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return objid if objid.isdigit() else None
+
+
+def image_name(scrapy) -> str:
+    """根据图片任务生成带序号的文件名，以保持原始顺序。
+
+    :param scrapy: 记录任务信息的数据体
+    :return str: 文件名，如 [01]xxx.jpg
+    """
+    try:
+        name = re.findall(r'(?<=/)\w*?\.(?:jpg|gif|png|bmp)', scrapy.url, re.IGNORECASE)[0]
+    except IndexError:
+        name = uuid4().hex + '.jpg'
+    return f'[{scrapy.index + 1 or 0:02d}]{name}'
+
+
+class ImageStream(object):
+    """逐块读取图片内容的可迭代对象，读取完毕或出错时关闭响应。"""
+
+    def __init__(self, resp, limiter: TokenBucket = None, buffer: memoryview = None):
+        """
+        :param resp: 图片的流式响应
+        :param TokenBucket limiter: 带宽限速器
+        :param memoryview buffer: 复用的缓冲区，见 iter_blocks
+        """
+        self.resp = resp
+        self.limiter = limiter
+        self.buffer = buffer
+        headers = getattr(resp, 'headers', {})
+        length = headers.get('Content-Length', '')
+        # 内容经过压缩时 Content-Length 不是图片的实际大小
+        self.size = int(length) if length.isdigit() and not headers.get('Content-Encoding') else None
+
+    def __iter__(self):
+        try:
+            for chunk in iter_blocks(self.resp, self.buffer):
+                if self.limiter:
+                    self.limiter.consume(len(chunk))
+                yield chunk
+        finally:
+            self.resp.close()
+
+
+def stream_image(scrapy, thumbnail: bool = False, limiter: TokenBucket = None, buffer: memoryview = None):
+    """请求图片，返回逐块读取图片内容的迭代器。请求失败时立即抛出异常。
+
+    :param scrapy: 记录任务信息的数据体
+    :param bool thumbnail: 是否下载缩略图
+    :param TokenBucket limiter: 带宽限速器
+    :param memoryview buffer: 复用的缓冲区，产出的块在下一次迭代时被覆盖，只适用于立即写出内容的 sink
+    :return ImageStream: 图片内容块的迭代器，size 为 Content-Length，未知时为 None
+    """
+    url = scrapy.url
+    if thumbnail:
+        if url.lower().endswith(('jpg', 'png', 'bmp')):
+            url = f'{scrapy.url}@1280w_1l_2o_100sh.{url[-3:]}'
+    return ImageStream(session_request(url, stream=True), limiter, buffer)
+
+
+class StorageSink(object):
+    """将图片写入存储后端，路径为 <title>/[序号]文件名。"""
+
+    def __init__(self, storage: Storage, overwrite: bool = False):
+        """
+        :param Storage storage: 存储后端，如 LocalStorage、S3Storage、ShardedArchive
+        :param bool overwrite: 是否覆盖已存在的文件
+        """
+        self.storage = storage
+        self.overwrite = overwrite
+
+    def path(self, scrapy) -> str:
+        return f'{safe_filename(scrapy.title)}/{image_name(scrapy)}'
+
+    def exists(self, scrapy) -> bool:
+        """文件已存在且不覆盖时返回 True，调用方可跳过下载。"""
+        return (not self.overwrite) and self.storage.exists(self.path(scrapy))
+
+    def __call__(self, scrapy, chunks):
+        self.storage.write(self.path(scrapy), chunks, getattr(chunks, 'size', None))
+
+
+class DirectorySink(StorageSink):
+    """将图片保存到本地目录 <directory>/<title>/[序号]文件名。"""
+
+    def __init__(self, directory, overwrite: bool = False):
+        """
+        :param str directory: 保存目录
+        :param bool overwrite: 是否覆盖已存在的文件
+        """
+        super().__init__(LocalStorage(directory), overwrite)
+
+
 class ZCoolScraper():
 
     def __init__(self, user_id=None, username=None, collection=None, destination=None,
                  max_pages=None, spec_topics=None, max_topics=None, max_workers=None,
-                 retries=None, redownload=None, overwrite=False, thumbnail=False):
+                 page_workers=None, topic_workers=None, download_workers=None, retries=None,
+                 redownload=None, overwrite=False, thumbnail=False, http2=False,
+                 max_bandwidth=None, small_first=False, metadata_only=False, metadata_format='jsonl',
+                 archive=None, shard_size=None, keep_records=True, verbose=True, autorun=True):
         """初始化下载参数。
 
         :param int user_id: 用户 ID
         :param str username: 用户名
         :param HttpUrl collection: 收藏集 URL
-        :param str destination: 图片保存到本地的路径，默认当前路径
+        :param str destination: 图片的保存路径，默认当前路径，s3://<bucket>/<prefix> 表示保存到 S3 兼容的对象存储
         :param int max_pages: 最大爬取页数，默认所有
         :param list spec_topics: 需要下载的特定主题
         :param int max_topics: 最大下载主题数量，默认所有
-        :param int max_workers: 线程开启个数，默认 20
+        :param int max_workers: 线程开启个数，默认 20，未指定 download_workers 时作为下载图片的线程数
+        :param int page_workers: 解析主页的线程数，默认 4
+        :param int topic_workers: 解析主题的线程数，默认 8
+        :param int download_workers: 下载图片的线程数，默认 max_workers
         :param int retries: 请求异常时的重试次数，默认 3
         :param str redownload: 下载记录文件，给定此文件则从失败记录进行下载
         :param bool overwrite: 是否覆盖已存在的文件，默认 False
         :param bool thumbnail: 是否下载缩略图，默认 False
+        :param bool http2: 是否使用 HTTP/2 多路复用连接（需安装 httpx[http2]），默认 False
+        :param float max_bandwidth: 所有线程共享的最大下载带宽，MB/s，默认不限制
+        :param bool small_first: 是否优先下载图片数量少的主题，默认 False
+        :param bool metadata_only: 是否只导出图片元数据而不下载图片，默认 False
+        :param str metadata_format: 元数据的导出格式，jsonl 或 parquet，默认 jsonl
+        :param str archive: 将图片写入 tar 或 zip 分片而非单个文件，默认不使用
+        :param float shard_size: 单个分片的最大大小，MB，默认 1024
+        :param bool keep_records: 是否将下载记录边下载边保存到 <保存路径>/<开始时间>.jsonl，默认 True
+        :param bool verbose: 是否在终端输出信息及进度，默认 True
+        :param bool autorun: 是否在初始化时立即解析所有主页、主题，默认 True
         """
         self.start_time = datetime.now()
-        print(f' - - - - - -+-+ {self.start_time.ctime()} +-+- - - - - -\n')
+        self.verbose = verbose
+        self.echo(f' - - - - - -+-+ {self.start_time.ctime()} +-+- - - - - -\n')
+        self.user_id = user_id
+        self.username = username
         self.collection = collection
+        self.destination = destination
+        self.redownload = redownload
+        self.max_pages = max_pages
         self.spec_topics = spec_topics
         self.max_topics = max_topics or 'all'
-        self.max_workers = max_workers or MAX_WORKERS
-        self.pool = ThreadPoolExecutor(self.max_workers)
+        # 每个阶段使用独立的线程池，解析主页、主题不必排在大量下载任务之后
+        self.max_workers = download_workers or max_workers or MAX_WORKERS
+        self.page_workers = page_workers or PAGE_WORKERS
+        self.topic_workers = topic_workers or TOPIC_WORKERS
+        self.page_pool = ThreadPoolExecutor(self.page_workers, thread_name_prefix='page')
+        self.topic_pool = ThreadPoolExecutor(self.topic_workers, thread_name_prefix='topic')
+        self.download_pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='download')
         self.overwrite = overwrite
         self.thumbnail = thumbnail
-        self.pages = Queue()
-        self.topics = Queue()
-        self.images = Queue()
+        self.sink = None
+        self.archive_format = archive
+        self.shard_size = shard_size * MB if shard_size else SHARD_SIZE
+        self.archive = None
+        self.metadata_only = metadata_only
+        self.metadata_format = metadata_format
+        self.metadata = None
+        self.keep_records = keep_records
+        self.records = None
+        self.limiter = TokenBucket(max_bandwidth * MB) if max_bandwidth else None
+        self.small_first = small_first
+        # 下载过失败的任务排在新任务之后；同一主题的图片连续下载，尽早得到完整的主题
+        self.retried = TaskSet()
+        self.works = {}
+        self.work_order = count()
+        self.pages = PriorityTaskQueue(key=lambda s: (s in self.retried) << 32 | s.index)
+        self.topics = PriorityTaskQueue(key=lambda s: int(s in self.retried))
+        self.images = PriorityTaskQueue(key=self.image_priority)
         self.stat = {
             'npages': 0,
             'ntopics': 0,
             'nimages': 0,
-            'pages_pass': set(),
-            'pages_fail': set(),
-            'topics_pass': set(),
-            'topics_fail': set(),
-            'images_pass': set(),
-            'images_fail': set()
+            'pages_pass': TaskSet(),
+            'pages_fail': TaskSet(),
+            'topics_pass': TaskSet(),
+            'topics_fail': TaskSet(),
+            'images_pass': TaskSet(),
+            'images_fail': TaskSet()
         }
 
         if retries:
@@ -116,11 +495,38 @@ class ZCoolScraper():
             global RETRIES
             RETRIES = retries
 
-        dest = Path(destination or '', urlparse(HOST_PAGE).netloc)
+        if http2 and httpx is None:
+            raise ZCoolError('HTTP/2 requires httpx, try "pip install httpx[http2]".')
+        # 主页及主题请求同一主机，图片请求 CDN，每个主机的连接数取各阶段所需的最大值
+        configure_transport(max(self.page_workers + self.topic_workers, self.max_workers), http2)
+
+        self.END_PARSING_TOPICS = False
+        self.stopped = False
+        if autorun:
+            self.fetch_all(initialized=self.resolve())
+
+    def echo(self, message='', color=None, **kwargs):
+        """在终端输出信息，verbose 为 False 时不输出。
+
+        :param str message: 信息
+        :param str color: 文字颜色
+        """
+        if self.verbose:
+            cprint(message, color, **kwargs)
+
+    def resolve(self):
+        """解析用户、收藏集或下载记录，确定保存路径及需要爬取的页数。
+
+        :return bool: 任务队列是否已初始化，即无需再根据页数生成主页任务
+        """
+        # 保存到对象存储时，下载记录等文件仍保存在本地的当前路径下
+        local = '' if is_remote(self.destination) else self.destination
+        dest = Path(local or '', urlparse(HOST_PAGE).netloc)
+        user_id, username, max_pages = self.user_id, self.username, self.max_pages
 
         # 从记录文件中的失败项开始下载
-        if redownload:
-            self.username = self.reload_records(redownload)
+        if self.redownload:
+            self.username = self.reload_records(self.redownload)
             self.user_id = self.search_id_by_username(self.username)
             self.max_pages = self.pages.qsize()
             self.max_topics = self.topics.qsize()
@@ -130,18 +536,18 @@ class ZCoolScraper():
                 'ntopics': self.max_topics,
                 'nimages': self.images.qsize()
             })
-            print(f'{"Username".rjust(17)}: {colored(self.username, "cyan")}\n'
-                  f'{"User ID".rjust(17)}: {self.user_id}\n'
-                  f'{"Pages to scrapy".rjust(17)}: {self.max_pages:2d}\n'
-                  f'{"Topics to scrapy".rjust(17)}: {self.max_topics:3d}\n'
-                  f'{"Images to scrapy".rjust(17)}: {self.images.qsize():4d}\n'
-                  f'Storage directory: {colored(self.directory, attrs=["underline"])}', end='\n\n')
-            self.fetch_all(initialized=True)
-            return
+            self.open_outputs()
+            self.echo(f'{"Username".rjust(17)}: {colored(self.username, "cyan")}\n'
+                      f'{"User ID".rjust(17)}: {self.user_id}\n'
+                      f'{"Pages to scrapy".rjust(17)}: {self.max_pages:2d}\n'
+                      f'{"Topics to scrapy".rjust(17)}: {self.max_topics:3d}\n'
+                      f'{"Images to scrapy".rjust(17)}: {self.images.qsize():4d}\n'
+                      f'Storage directory: {colored(self.directory, attrs=["underline"])}', end='\n\n')
+            return True
 
         # 从收藏集下载
-        if collection:
-            objid = self.parse_objid(collection, is_collection=True)
+        if self.collection:
+            objid = self.parse_objid(self.collection, is_collection=True)
             resp = session_request(urljoin(HOST_PAGE, COLLECTION_SUFFIX.format(objid=objid, page=1)))
             data = resp.json().get('data', {})
             total = data.get('total', 0)
@@ -165,21 +571,19 @@ class ZCoolScraper():
             try:
                 response = session_request(self.base_url)
             except requests.exceptions.ProxyError:
-                cprint('Cannot connect to proxy.', 'red')
-                sys.exit(1)
+                raise ZCoolError('Cannot connect to proxy.')
             except Exception as e:
-                cprint(f'Failed to connect to {self.base_url}, {e}', 'red')
-                sys.exit(1)
+                raise ZCoolError(f'Failed to connect to {self.base_url}, {e}')
 
             soup = BeautifulSoup(markup=response.text, features='html.parser')
             try:
                 author = soup.find(name='div', id='body').get('data-name')
-                if username and username != author:
-                    cprint(f'Invalid user id:「{user_id}」or username:「{username}」!', 'red')
-                    sys.exit(1)
-                self.username = author
             except Exception:
                 self.username = username or 'anonymous'
+            else:
+                if username and username != author:
+                    raise ZCoolError(f'Invalid user id:「{user_id}」or username:「{username}」!')
+                self.username = author
             self.directory = dest / safe_filename(self.username)
             try:
                 max_pages_ = int(soup.find(id='laypage_0').find_all(name='a')[-2].text)
@@ -193,15 +597,36 @@ class ZCoolScraper():
             topics = 'all'
         else:
             topics = self.max_pages * self.max_topics
-        print(f'{"Username".rjust(17)}: {colored(self.username, "cyan")}\n'
-              f'{"User ID".rjust(17)}: {self.user_id}\n'
-              f'{"Maximum pages".rjust(17)}: {max_pages_}\n'
-              f'{"Pages to scrapy".rjust(17)}: {self.max_pages}\n'
-              f'{"Topics to scrapy".rjust(17)}: {topics}\n'
-              f'Storage directory: {colored(self.directory, attrs=["underline"])}', end='\n\n')
+        self.open_outputs()
+        self.echo(f'{"Username".rjust(17)}: {colored(self.username, "cyan")}\n'
+                  f'{"User ID".rjust(17)}: {self.user_id}\n'
+                  f'{"Maximum pages".rjust(17)}: {max_pages_}\n'
+                  f'{"Pages to scrapy".rjust(17)}: {self.max_pages}\n'
+                  f'{"Topics to scrapy".rjust(17)}: {topics}\n'
+                  f'Storage directory: {colored(self.directory, attrs=["underline"])}', end='\n\n')
+        return bool(self.collection)
 
-        self.END_PARSING_TOPICS = False
-        self.fetch_all(initialized=True if self.collection else False)
+    def open_outputs(self):
+        """根据保存路径创建图片的 sink，只导出元数据时创建元数据文件。"""
+        if self.archive_format:
+            self.archive = ShardedArchive(self.directory, self.archive_format, self.shard_size)
+            self.sink = StorageSink(self.archive, self.overwrite)
+        else:
+            try:
+                storage = open_storage(self.destination)
+            except ImportError as e:
+                raise ZCoolError(str(e))
+            storage = storage.sub(urlparse(HOST_PAGE).netloc, self.directory.name)
+            self.sink = StorageSink(storage, self.overwrite)
+        if self.keep_records:
+            filename = f'{safe_filename(self.start_time.isoformat()[:-7])}.jsonl'
+            self.records = RecordWriter(self.directory / filename, self.start_time)
+        if self.metadata_only:
+            filename = f'{safe_filename(self.start_time.isoformat()[:-7])}.metadata.{self.metadata_format}'
+            try:
+                self.metadata = MetadataWriter(self.directory / filename, self.metadata_format)
+            except (ImportError, ValueError) as e:
+                raise ZCoolError(str(e))
 
     def search_id_by_username(self, username):
         """通过用户昵称查找用户 ID。
@@ -210,23 +635,19 @@ class ZCoolScraper():
         :return int: 用户 ID
         """
         if not username:
-            cprint('Must give an <user id> or <username>!', 'yellow')
-            sys.exit(1)
+            raise ZCoolError('Must give an <user id> or <username>!')
 
         search_url = urljoin(HOST_PAGE, SEARCH_DESIGNER_SUFFIX.format(word=username))
         try:
             response = session_request(search_url)
         except requests.exceptions.ProxyError:
-            cprint('Cannot connect to proxy.', 'red')
-            sys.exit(1)
+            raise ZCoolError('Cannot connect to proxy.')
         except Exception as e:
-            cprint(f'Failed to connect to {search_url}, {e}', 'red')
-            sys.exit(1)
+            raise ZCoolError(f'Failed to connect to {search_url}, {e}')
 
         author_1st = BeautifulSoup(response.text, 'html.parser').find(name='div', class_='author-info')
         if (not author_1st) or (author_1st.get('data-name') != username):
-            cprint(f'Username「{username}」does not exist!', 'yellow')
-            sys.exit(1)
+            raise ZCoolError(f'Username「{username}」does not exist!')
 
         return author_1st.get('data-id')
 
@@ -236,16 +657,38 @@ class ZCoolScraper():
         :param str file: 下载记录文件的路径。
         :return str: 用户名
         """
-        with open(file, 'r', encoding='utf-8') as f:
-            for fail in json.loads(f.read()).get('fail'):
-                scrapy = Scrapy._make(fail.values())
-                if scrapy.type == 'page':
-                    self.pages.put(scrapy)
-                elif scrapy.type == 'topic':
-                    self.topics.put(scrapy)
-                elif scrapy.type == 'image':
-                    self.images.put(scrapy)
-            return scrapy.author
+        if file.endswith('.jsonl'):
+            fails = load_failed_records(file)
+        else:
+            # 兼容旧版本的 JSON 记录文件
+            with open(file, 'r', encoding='utf-8') as f:
+                fails = json.loads(f.read()).get('fail')
+        if not fails:
+            raise ZCoolError(f'No failed records in {file}.')
+
+        for fail in fails:
+            # 每行记录的作者、标题都是新的字符串，驻留后相同的值只保留一份
+            fail.update(author=intern(fail.get('author')), title=intern(fail.get('title')))
+            scrapy = Scrapy(**fail)
+            self.retried.add(scrapy)
+            if scrapy.type == 'page':
+                self.pages.put(scrapy)
+            elif scrapy.type == 'topic':
+                self.topics.put(scrapy)
+            elif scrapy.type == 'image':
+                self.images.put(scrapy)
+        return scrapy.author
+
+    def image_priority(self, scrapy):
+        """计算图片下载任务的优先级：失败过的排在最后，其次按主题被发现的顺序、图片序号排列。
+
+        :param scrapy: 记录任务信息的数据体
+        :return int: 优先级
+        """
+        order, size = self.works.get(scrapy.objid, (0, 0))
+        size = min(size, 0xFFFF) if self.small_first else 0
+        # 依次为：是否失败过（1 位）、图片数（16 位）、主题顺序（32 位）、图片序号（16 位）
+        return (scrapy in self.retried) << 64 | size << 48 | order << 16 | min(scrapy.index, 0xFFFF)
 
     def generate_pages(self):
         """根据最大下载页数，生成需要爬取主页的任务。"""
@@ -275,6 +718,8 @@ class ZCoolScraper():
         :param scrapy: 记录任务信息的数据体
         :return Scrapy: 记录任务信息的数据体
         """
+        if self.stopped:
+            return scrapy
         resp = session_request(scrapy.url)
         cards = BeautifulSoup(resp.text, 'html.parser').find_all(name='a', class_='card-img-hover')
         for idx, card in enumerate(cards if self.max_topics == 'all' else cards[:self.max_topics + 1]):
@@ -282,8 +727,10 @@ class ZCoolScraper():
             if self.spec_topics and (title not in self.spec_topics):
                 continue
 
+            # objid 直接从作品 URL 中解析，parse_images 无需再请求作品页面
+            url = card.get('href')
             new_scrapy = Scrapy(type='topic', author=scrapy.author, title=title,
-                                objid=None, index=idx, url=card.get('href'))
+                                objid=decode_objid(url), index=idx, url=url)
             if new_scrapy not in self.stat["topics_pass"]:
                 self.topics.put(new_scrapy)
                 self.stat["ntopics"] += 1
@@ -292,10 +739,10 @@ class ZCoolScraper():
     def fetch_topics(self):
         """从任务队列中获取要爬取的主页，使用多线程处理得到需要爬取的主题。"""
         page_futures = {}
-        while True:
+        while not self.stopped:
             try:
                 scrapy = self.pages.get(timeout=Q_TIMEOUT)
-                page_futures[self.pool.submit(self.parse_topics, scrapy)] = scrapy
+                page_futures[self.page_pool.submit(self.parse_topics, scrapy)] = scrapy
             except Empty:
                 break
             except Exception:
@@ -305,10 +752,10 @@ class ZCoolScraper():
             scrapy = page_futures.get(future)
             try:
                 future.result()
-                self.stat["pages_pass"].add(scrapy)
+                self.record("pages_pass", scrapy)
             except Exception:
-                self.stat["pages_fail"].add(scrapy)
-                cprint(f'GET page: {scrapy.title} ({scrapy.url}) failed.', 'red')
+                self.record("pages_fail", scrapy)
+                self.echo(f'GET page: {scrapy.title} ({scrapy.url}) failed.', 'red')
         self.END_PARSING_TOPICS = True
 
     def parse_objid(self, url: str, is_collection: bool = False) -> str:
@@ -327,23 +774,30 @@ class ZCoolScraper():
         return objid
 
     def parse_images(self, scrapy):
-        """爬取 topic，获得 objid 后直接调用 API，从返回数据里获得图片地址等信息，
+        """调用作品 API，从返回数据里获得图片地址等信息，并将下载图片的任务添加到任务队列。
 
-        并将下载图片的任务添加到任务队列。
+        topic 中没有 objid 时（如旧版本的下载记录），先爬取 topic 页面解析 objid。
         :param scrapy: 记录任务信息的数据体
         :return Scrapy: 记录任务信息的数据体
         """
+        if self.stopped:
+            return scrapy
         objid = scrapy.objid or self.parse_objid(scrapy.url)
         resp = session_request(urljoin(HOST_PAGE, WORK_SUFFIX.format(objid=objid)))
         data = resp.json().get('data', {})
-        author = data.get('product', {}).get('creatorObj', {}).get('username')
+        author = intern(data.get('product', {}).get('creatorObj', {}).get('username'))
         title = data.get('product', {}).get('title')
         objid = data.get('product', {}).get('id')
+        images = data.get('allImageList', [])
+        self.works.setdefault(objid, (next(self.work_order), len(images)))
 
-        for img in data.get('allImageList', []):
+        for img in images:
             new_scrapy = Scrapy(type='image', author=author, title=title,
                                 objid=objid, index=img.get('orderNo') or 0, url=img.get('url'))
-            if new_scrapy not in self.stat["images_pass"]:
+            if self.metadata:
+                self.metadata.write(new_scrapy._asdict())
+                self.stat["nimages"] += 1
+            elif new_scrapy not in self.stat["images_pass"]:
                 self.images.put(new_scrapy)
                 self.stat["nimages"] += 1
         return scrapy
@@ -351,10 +805,10 @@ class ZCoolScraper():
     def fetch_images(self):
         """从任务队列中获取要爬取的主题，使用多线程处理得到需要下载的图片。"""
         image_futures = {}
-        while True:
+        while not self.stopped:
             try:
                 scrapy = self.topics.get(timeout=Q_TIMEOUT)
-                image_futures[self.pool.submit(self.parse_images, scrapy)] = scrapy
+                image_futures[self.topic_pool.submit(self.parse_images, scrapy)] = scrapy
             except Empty:
                 if self.END_PARSING_TOPICS:
                     break
@@ -365,27 +819,54 @@ class ZCoolScraper():
             scrapy = image_futures.get(future)
             try:
                 future.result()
-                self.stat["topics_pass"].add(scrapy)
+                self.record("topics_pass", scrapy)
             except Exception:
-                self.stat["topics_fail"].add(scrapy)
-                cprint(f'GET topic: {scrapy.title} ({scrapy.url}) failed.', 'red')
+                self.record("topics_fail", scrapy)
+                self.echo(f'GET topic: {scrapy.title} ({scrapy.url}) failed.', 'red')
 
     def fetch_all(self, initialized: bool = False):
-        """同时爬取主页、主题，并更新状态。"""
+        """同时爬取主页、主题，并更新状态。
+
+        分发任务的两个循环在独立的线程中运行，不占用各阶段线程池的线程。
+        """
         if not initialized:
             self.generate_pages()
-        fetch_futures = [self.pool.submit(self.fetch_topics),
-                         self.pool.submit(self.fetch_images)]
+        fetchers = [threading.Thread(target=self.fetch_topics, daemon=True),
+                    threading.Thread(target=self.fetch_images, daemon=True)]
+        for fetcher in fetchers:
+            fetcher.start()
         end_show_fetch = False
         t = threading.Thread(target=self.show_fetch_status, kwargs={'end': lambda: end_show_fetch})
-        t.start()
+        if self.verbose:
+            t.start()
         try:
-            wait(fetch_futures)
+            for fetcher in fetchers:
+                fetcher.join()
         except KeyboardInterrupt:
             raise
         finally:
             end_show_fetch = True
-            t.join()
+            if self.verbose:
+                t.join()
+
+    def iter_images(self):
+        """边解析主页、主题，边产出需要下载的图片任务，不下载图片。
+
+        生成器被关闭（如调用方提前 break）时停止解析新的主页及主题。
+
+        :return Iterator[Scrapy]: 图片任务
+        """
+        fetcher = threading.Thread(target=self.fetch_all, kwargs={'initialized': self.resolve()}, daemon=True)
+        fetcher.start()
+        try:
+            while True:
+                try:
+                    yield self.images.get(timeout=Q_TIMEOUT)
+                except Empty:
+                    if not fetcher.is_alive() and self.images.empty():
+                        break
+        finally:
+            self.stopped = True
 
     def show_fetch_status(self, interval=0.5, end=None):
         """用于后台线程，实现边爬取边显示状态。
@@ -431,95 +912,163 @@ class ZCoolScraper():
          :param scrapy: 记录任务信息的数据体
          :return Scrapy: 记录任务信息的数据体
          """
-        try:
-            name = re.findall(r'(?<=/)\w*?\.(?:jpg|gif|png|bmp)', scrapy.url, re.IGNORECASE)[0]
-        except IndexError:
-            name = uuid4().hex + '.jpg'
-
-        path = self.directory / safe_filename(scrapy.title)
-        filename = path / f'[{scrapy.index + 1 or 0:02d}]{name}'
-        if (not self.overwrite) and op.isfile(filename):
+        if self.sink.exists(scrapy):
             return scrapy
+        self.sink(scrapy, stream_image(scrapy, self.thumbnail, self.limiter, thread_buffer()))
+        return scrapy
 
-        url = scrapy.url
-        if self.thumbnail:
-            if url.lower().endswith(('jpg', 'png', 'bmp')):
-                url = f'{scrapy.url}@1280w_1l_2o_100sh.{url[-3:]}'
-        resp = session_request(url)
+    def shutdown(self, wait: bool = True):
+        """关闭各阶段的线程池。
 
-        mkdirs_if_not_exist(path)
-        with open(filename, 'wb') as f:
-            for chunk in resp.iter_content(8192):
-                f.write(chunk)
-        return scrapy
+        :param bool wait: 是否等待进行中的任务完成
+        """
+        for pool in (self.page_pool, self.topic_pool, self.download_pool):
+            pool.shutdown(wait=wait)
+
+    def record(self, key, scrapy):
+        """更新任务状态，并将下载记录追加到记录文件。
+
+        :param str key: stat 中的状态，如 images_pass、images_fail
+        :param scrapy: 记录任务信息的数据体
+        """
+        self.stat[key].add(scrapy)
+        if self.records:
+            self.records.write('success' if key.endswith('_pass') else 'fail', scrapy)
 
     def save_records(self):
-        """将成功及失败的下载记录保存到本地文件。
+        """等待所有下载记录写入本地文件。
 
         :return str: 记录文件的路径
         """
-        filename = f'{safe_filename(self.start_time.isoformat()[:-7])}.json'
-        abspath = op.abspath(self.directory / filename)
-        with open(abspath, 'w', encoding='utf-8') as f:
-            success = (self.stat["pages_pass"] | self.stat["topics_pass"] | self.stat["images_pass"])
-            fail = (self.stat["pages_fail"] | self.stat["topics_fail"] | self.stat["images_fail"])
-            type_order = {'page': 1, 'topic': 2, 'image': 3}
-            s_ordered = sort_records(success, order=type_order)
-            f_ordered = sort_records(fail, order=type_order)
-
-            records = {
-                'time': self.start_time.isoformat(),
-                'success': [scrapy._asdict() for scrapy in s_ordered],
-                'fail': [scrapy._asdict() for scrapy in f_ordered]
-            }
-            f.write(json.dumps(records, ensure_ascii=False, indent=2))
-        return abspath
+        if self.records:
+            path = self.records.close()
+            return op.abspath(path) if path else None
 
     def run_scraper(self):
         """使用多线程下载所有图片，完成后保存记录并退出程序。"""
+        if self.metadata:
+            # 从下载记录重新加载的图片任务不经过 parse_images，在此导出其元数据
+            while True:
+                try:
+                    self.metadata.write(self.images.get_nowait()._asdict())
+                except Empty:
+                    break
+            self.metadata.close()
+            self.save_records()
+            if self.metadata.count:
+                self.echo(f'Saved metadata of {colored(self.metadata.count, "green")} images to '
+                          f'{colored(self.metadata.path.absolute(), attrs=["underline"])}')
+            else:
+                self.echo('No images found.', 'yellow')
+            return
+
         end_show_download = False
         t = threading.Thread(target=self.show_download_status, kwargs={'end': lambda: end_show_download})
-        t.start()
-
-        image_futuress = {}
-        while True:
-            try:
-                scrapy = self.images.get_nowait()
-                if scrapy not in self.stat["images_pass"]:
-                    image_futuress[self.pool.submit(self.download_image, scrapy)] = scrapy
-            except Empty:
-                break
-            except KeyboardInterrupt:
-                raise
-            except Exception:
-                continue
+        if self.verbose:
+            t.start()
 
+        # 同时进行中的下载不超过 2 * 下载线程数，其余任务留在队列中，不必为每个任务创建 Future
+        image_futures = {}
         try:
-            for future in as_completed(image_futuress):
-                scrapy = image_futuress.get(future)
-                try:
-                    future.result()
-                    self.stat["images_pass"].add(scrapy)
-                except Exception:
-                    self.stat["images_fail"].add(scrapy)
-                    cprint(f'Download image: {scrapy.title}[{scrapy.index + 1}] '
-                           f'({scrapy.url}) failed.', 'red')
+            while True:
+                while len(image_futures) < 2 * self.max_workers:
+                    try:
+                        scrapy = self.images.get_nowait()
+                    except Empty:
+                        break
+                    if scrapy not in self.stat["images_pass"]:
+                        image_futures[self.download_pool.submit(self.download_image, scrapy)] = scrapy
+                if not image_futures:
+                    break
+                done, _ = wait(image_futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scrapy = image_futures.pop(future)
+                    try:
+                        future.result()
+                        self.record("images_pass", scrapy)
+                    except Exception:
+                        self.record("images_fail", scrapy)
+                        self.echo(f'Download image: {scrapy.title}[{scrapy.index + 1}] '
+                                  f'({scrapy.url}) failed.', 'red')
         except KeyboardInterrupt:
             raise
         finally:
             end_show_download = True
-            t.join()
+            if self.verbose:
+                t.join()
+            if self.archive:
+                self.archive.close()
 
         saved_images = len(self.stat["images_pass"])
         failed_images = len(self.stat["images_fail"])
         if saved_images or failed_images:
             if saved_images:
-                print(f'Saved {colored(saved_images, "green")} images to '
-                      f'{colored(self.directory.absolute(), attrs=["underline"])}')
+                self.echo(f'Saved {colored(saved_images, "green")} images to '
+                          f'{colored(self.sink.storage, attrs=["underline"])}')
             records_path = self.save_records()
-            print(f'Saved records to {colored(records_path, attrs=["underline"])}')
+            if records_path:
+                self.echo(f'Saved records to {colored(records_path, attrs=["underline"])}')
+            stats = get_transport_stats()
+            if stats['reused'] is not None:
+                self.echo(f'Requests: {stats["requests"]}, new connections: {stats["connections"]}, '
+                          f'reused: {colored(stats["reused"], "green")}')
         else:
-            cprint('No images to download.', 'yellow')
+            self.save_records()
+            self.echo('No images to download.', 'yellow')
+
+
+def iter_images(user_id=None, username=None, collection=None, **options):
+    """流式产出用户或收藏集中所有图片的 Scrapy 记录，不下载、不在终端输出。
+
+    记录在解析到时即被产出，调用方可随时停止迭代，未解析的主页及主题不会再被请求。
+
+    :param int user_id: 用户 ID
+    :param str username: 用户名
+    :param HttpUrl collection: 收藏集 URL
+    :param options: ZCoolScraper 的其他参数，如 max_pages、spec_topics、max_workers
+    :return Iterator[Scrapy]: 图片任务
+    """
+    scraper = ZCoolScraper(user_id=user_id, username=username, collection=collection,
+                           keep_records=False, verbose=False, autorun=False, **options)
+    yield from scraper.iter_images()
+
+
+def download(records, sink, max_workers: int = MAX_WORKERS, thumbnail: bool = False,
+             max_bandwidth: float = None):
+    """多线程下载图片，按完成顺序产出 (scrapy, exception) 结果，成功时 exception 为 None。
+
+    records 可以是 iter_images 返回的生成器，同时进行中的下载不超过 2 * max_workers 个。
+
+    :param Iterable[Scrapy] records: 图片任务
+    :param sink: 接收 (scrapy, chunks) 的可调用对象，如 DirectorySink；若有 exists(scrapy) 方法且返回 True 则跳过
+    :param int max_workers: 线程数
+    :param bool thumbnail: 是否下载缩略图
+    :param float max_bandwidth: 最大下载带宽，MB/s
+    :return Iterator[tuple]: (scrapy, exception)
+    """
+    limiter = TokenBucket(max_bandwidth * MB) if max_bandwidth else None
+    exists = getattr(sink, 'exists', None)
+
+    def save(scrapy):
+        if exists and exists(scrapy):
+            return
+        # StorageSink 读到每块内容后立即写出，可以复用线程的缓冲区；其他 sink 可能保留内容块的引用
+        buffer = thread_buffer() if isinstance(sink, StorageSink) else None
+        sink(scrapy, stream_image(scrapy, thumbnail, limiter, buffer))
+
+    records = iter(records)
+    with ThreadPoolExecutor(max_workers) as pool:
+        futures = {}
+        while True:
+            for scrapy in records:
+                futures[pool.submit(save, scrapy)] = scrapy
+                if len(futures) >= 2 * max_workers:
+                    break
+            if not futures:
+                break
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield futures.pop(future), future.exception()
 
 
 @click.command()
@@ -527,40 +1076,75 @@ class ZCoolScraper():
 @click.option('-i', '--ids', 'ids', help='One or more user IDs, separated by commas.')
 @click.option('-c', '--collections', 'collections', help='One or more collection URLs, separated by commas.')
 @click.option('-t', '--topics', 'topics', help='Specific topics to download, separated by commas.')
-@click.option('-d', '--destination', 'destination', help='Destination to save images.')
+@click.option('-d', '--destination', 'destination',
+              help='Destination to save images, a local path or s3://<bucket>/<prefix>.')
 @click.option('-R', '--retries', 'retries', default=RETRIES, show_default=True, type=int,
               help='Repeat download for failed images.')
 @click.option('-r', '--redownload', 'redownload',
-              help='Redownload images from failed records (PATH of the .json file).')
+              help='Redownload images from failed records (PATH of the .jsonl or .json file).')
 @click.option('-o', '--overwrite', 'overwrite', is_flag=True, default=False, help='Override the existing files.')
 @click.option('--thumbnail', 'thumbnail', is_flag=True, default=False,
               help='Download thumbnails with a maximum width of 1280px.')
 @click.option('--max-pages', 'max_pages', type=int, help='Maximum pages to download.')
 @click.option('--max-topics', 'max_topics', type=int, help='Maximum topics per page to download.')
 @click.option('--max-workers', 'max_workers', default=MAX_WORKERS, show_default=True, type=int,
-              help='Maximum thread workers.')
+              help='Maximum thread workers, used for downloads unless --download-workers is given.')
+@click.option('--page-workers', 'page_workers', default=PAGE_WORKERS, show_default=True, type=int,
+              help='Thread workers parsing pages.')
+@click.option('--topic-workers', 'topic_workers', default=TOPIC_WORKERS, show_default=True, type=int,
+              help='Thread workers parsing topics.')
+@click.option('--download-workers', 'download_workers', type=int,
+              help='Thread workers downloading images, defaults to --max-workers.')
+@click.option('--http2', 'http2', is_flag=True, default=False,
+              help='Share multiplexed HTTP/2 connections between workers (requires httpx[http2]).')
+@click.option('--max-bandwidth', 'max_bandwidth', type=float,
+              help='Maximum download bandwidth shared by all workers, in MB/s.')
+@click.option('--small-first', 'small_first', is_flag=True, default=False,
+              help='Download topics with fewer images first.')
+@click.option('--archive', 'archive', type=click.Choice(ARCHIVE_FORMATS),
+              help='Write images into size-bounded tar or zip shards instead of single files.')
+@click.option('--shard-size', 'shard_size', type=float, default=SHARD_SIZE // MB, show_default=True,
+              help='Maximum size of each archive shard, in MB.')
+@click.option('--metadata-only', 'metadata_only', is_flag=True, default=False,
+              help='Export image metadata only, without downloading images.')
+@click.option('--metadata-format', 'metadata_format', type=click.Choice(METADATA_FORMATS),
+              default='jsonl', show_default=True, help='File format of the exported metadata.')
 def zcool_command(ids, names, collections, destination, max_pages, topics, max_topics,
-                  max_workers, retries, redownload, overwrite, thumbnail):
+                  max_workers, page_workers, topic_workers, download_workers, retries, redownload,
+                  overwrite, thumbnail, http2, max_bandwidth, small_first, archive, shard_size,
+                  metadata_only, metadata_format):
     """ZCool picture crawler, download pictures, photos and illustrations of
     ZCool (https://zcool.com.cn/). Visit https://github.com/lonsty/scraper.
     """
-    if redownload:
-        scraper = ZCoolScraper(destination=destination, max_pages=max_pages, spec_topics=topics,
-                               max_topics=max_topics, max_workers=max_workers, retries=retries,
-                               redownload=redownload, overwrite=overwrite, thumbnail=thumbnail)
-        scraper.run_scraper()
-
-    elif any([ids, names, collections]):
-        topics = topics.split(',') if topics else []
-        resources = parse_resources(ids, names, collections)
-        for res in resources:
-            scraper = ZCoolScraper(user_id=res.id, username=res.name, collection=res.collection,
-                                   destination=destination, max_pages=max_pages, spec_topics=topics,
-                                   max_topics=max_topics, max_workers=max_workers, retries=retries,
-                                   redownload=redownload, overwrite=overwrite)
-            scraper.run_scraper()
-
-    else:
+    if not any([redownload, ids, names, collections]):
         click.echo('Try "python zcool.py --help" for help.')
         return 1
+
+    try:
+        if redownload:
+            scraper = ZCoolScraper(destination=destination, max_pages=max_pages, spec_topics=topics,
+                                   max_topics=max_topics, max_workers=max_workers, page_workers=page_workers,
+                                   topic_workers=topic_workers, download_workers=download_workers,
+                                   retries=retries, redownload=redownload, overwrite=overwrite,
+                                   thumbnail=thumbnail, http2=http2, max_bandwidth=max_bandwidth,
+                                   small_first=small_first, archive=archive, shard_size=shard_size,
+                                   metadata_only=metadata_only, metadata_format=metadata_format)
+            scraper.run_scraper()
+
+        else:
+            topics = topics.split(',') if topics else []
+            resources = parse_resources(ids, names, collections)
+            for res in resources:
+                scraper = ZCoolScraper(user_id=res.id, username=res.name, collection=res.collection,
+                                       destination=destination, max_pages=max_pages, spec_topics=topics,
+                                       max_topics=max_topics, max_workers=max_workers,
+                                       page_workers=page_workers, topic_workers=topic_workers,
+                                       download_workers=download_workers, retries=retries, redownload=redownload,
+                                       overwrite=overwrite, http2=http2, max_bandwidth=max_bandwidth,
+                                       small_first=small_first, archive=archive, shard_size=shard_size,
+                                       metadata_only=metadata_only, metadata_format=metadata_format)
+                scraper.run_scraper()
+    except ZCoolError as e:
+        cprint(str(e), 'red')
+        sys.exit(1)
     return 0
@@ -0,0 +1,82 @@
+# @FILENAME : test_archive
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import json
+import os
+import subprocess
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from scraper.archive import INDEX_FILE, ShardedArchive
+
+
+class TestShardedArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_tar_shards_and_index(self):
+        with ShardedArchive(self.directory, 'tar', shard_size=1500) as archive:
+            for i in range(3):
+                archive.write(f'title/[0{i}]{i}.jpg', [bytes([i]) * 500, bytes([i]) * 500])
+
+        assert sorted(p.name for p in self.directory.glob('shard-*')) == \
+            ['shard-00000.tar', 'shard-00001.tar', 'shard-00002.tar']
+        with open(self.directory / INDEX_FILE, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f]
+        for i, entry in enumerate(entries):
+            with open(self.directory / f'shard-{entry["shard"]:05d}.tar', 'rb') as f:
+                f.seek(entry['offset'])
+                assert f.read(entry['size']) == bytes([i]) * 1000
+        with tarfile.open(self.directory / 'shard-00001.tar') as tar:
+            assert tar.getnames() == ['title/[01]1.jpg']
+
+    def test_zip_resume(self):
+        with ShardedArchive(self.directory, 'zip') as archive:
+            archive.write('a.jpg', [b'a'])
+
+        archive = ShardedArchive(self.directory, 'zip')
+        assert archive.exists('a.jpg')
+        archive.write('b.jpg', [b'b'])
+        archive.close()
+        with zipfile.ZipFile(self.directory / 'shard-00001.zip') as zf:
+            assert zf.read('b.jpg') == b'b'
+
+    def test_interrupted_shard(self):
+        # 写入后进程直接退出，zip 分片没有中央目录
+        code = ('import os; from scraper.archive import ShardedArchive; '
+                f'archive = ShardedArchive({str(self.directory)!r}, "zip"); '
+                'archive.write("a.jpg", [b"a"]); os._exit(0)')
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+        with self.assertRaises(zipfile.BadZipFile):
+            zipfile.ZipFile(self.directory / 'shard-00000.zip')
+
+        archive = ShardedArchive(self.directory, 'zip')
+        assert not archive.exists('a.jpg')
+        archive.write('a.jpg', [b'a'])
+        archive.close()
+        with zipfile.ZipFile(self.directory / 'shard-00001.zip') as zf:
+            assert zf.read('a.jpg') == b'a'
+        with open(self.directory / INDEX_FILE, encoding='utf-8') as f:
+            assert [json.loads(line)['shard'] for line in f] == [1]
+
+    def test_truncated_tar_shard(self):
+        with ShardedArchive(self.directory, 'tar') as archive:
+            archive.write('a.jpg', [b'a' * 1000])
+            archive.write('b.jpg', [b'b' * 1000])
+        path = self.directory / 'shard-00000.tar'
+        with open(path, 'r+b') as f:
+            # a.jpg 完整，b.jpg 只写入了一半
+            f.truncate(512 + 1024 + 512 + 500)
+
+        archive = ShardedArchive(self.directory, 'tar')
+        assert archive.exists('a.jpg')
+        assert not archive.exists('b.jpg')
@@ -0,0 +1,207 @@
+# @FILENAME : test_cnu
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from collections import Counter
+from unittest import mock
+
+from aiohttp import web
+from ruia import Request
+
+from scraper import cnu
+from scraper.storage import LocalStorage, Storage
+from scraper.utils import MB, Fingerprints
+
+IMAGE_SIZE = 2 * MB + 100  # 大于 CHUNK_SIZE，需要分多块读取
+PAYLOAD = os.urandom(IMAGE_SIZE)
+
+
+class RecordingStorage(Storage):
+    """记录每个文件收到的内容块大小，以及写入是否因异常中止。"""
+
+    def __init__(self):
+        self.files = {}
+        self.aborted = []
+
+    def exists(self, path):
+        return path in self.files
+
+    def write(self, path, chunks, size=None):
+        sizes = []
+        try:
+            for chunk in chunks:
+                sizes.append(len(chunk))
+        except BaseException:
+            self.aborted.append(path)
+            raise
+        self.files[path] = sizes
+
+
+class StubSite(object):
+    """本地模拟的 CNU 站点：一个用户主页（含作品 1、2）、作品页及图片，记录每个请求的路径。"""
+
+    def __init__(self):
+        self.hits = Counter()
+        self.release = None
+        self.runner = None
+        self.base = None
+
+    async def handle(self, request):
+        self.hits[request.path_qs] += 1
+        if request.path.startswith('/users/'):
+            works = ''.join(f'<div class="work-thumbnail"><div class="author">a</div><div class="title">t</div>'
+                            f'<a class="thumbnail" href="{self.base}/works/{i}"></a></div>' for i in (1, 2))
+            return web.Response(text=f'<div class="pager_box"><ul><li>1</li><li>next</li></ul></div>{works}',
+                                content_type='text/html')
+        if request.path.startswith('/works/'):
+            work = request.path.rstrip('/').split('/')[-1]
+            imgs = json.dumps([{'img': f'{work}_{i}.jpg'} for i in range(2)])
+            return web.Response(text=f'<body><div class="author-info"><strong>a</strong></div>'
+                                     f'<div class="work-title">w{work}</div><div id="imgs_json">{imgs}</div></body>',
+                                content_type='text/html')
+        if request.path.startswith('/slow/'):
+            # 发送一块后停住，模拟下载到一半
+            resp = web.StreamResponse(headers={'Content-Length': str(IMAGE_SIZE)})
+            await resp.prepare(request)
+            await resp.write(PAYLOAD[:MB])
+            await self.release.wait()
+            return resp
+        return web.Response(body=PAYLOAD, content_type='image/jpeg')
+
+    async def start(self):
+        self.release = asyncio.Event()
+        app = web.Application()
+        app.router.add_get('/{tail:.*}', self.handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.base = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+class TestCNU(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.site = StubSite()
+        self.loop.run_until_complete(self.site.start())
+        self.directory = tempfile.TemporaryDirectory()
+        base = self.site.base
+        self.patcher = mock.patch.multiple(cnu, IMAGE_HOST=f'{base}/img/', AUTHOR_WORKS_PREFIX=f'{base}/users/',
+                                           WORK_PREFIX=f'{base}/works/')
+        self.patcher.start()
+
+    def tearDown(self):
+        self.patcher.stop()
+        self.loop.run_until_complete(self.site.stop())
+        self.loop.close()
+        self.directory.cleanup()
+
+    def crawl(self, start_urls, fingerprints):
+        self.loop.run_until_complete(cnu.CNUSpider.async_start(loop=self.loop, spider_config=dict(
+            start_urls=start_urls,
+            _storage=LocalStorage(self.directory.name),
+            _fingerprints=fingerprints
+        )))
+
+    def test_overlapping_start_urls(self):
+        """Test that overlapping /users/ and /works/ start URLs request each work and image once."""
+        base = self.site.base
+        path = os.path.join(self.directory.name, 'fingerprints')
+        start_urls = [f'{base}/users/9', f'{base}/works/1', f'{base}/users/9', f'{base}/works/2/']
+        with Fingerprints(path) as fingerprints:
+            self.crawl(start_urls, fingerprints)
+
+        works = {p: n for p, n in self.site.hits.items() if p.startswith('/works/')}
+        images = {p: n for p, n in self.site.hits.items() if p.startswith('/img/')}
+        assert sorted(works) == ['/works/1', '/works/2/'] and set(works.values()) == {1}
+        assert sorted(images) == ['/img/1_0.jpg', '/img/1_1.jpg', '/img/2_0.jpg', '/img/2_1.jpg']
+        assert set(images.values()) == {1}
+        saved = [os.path.join(root, f) for root, _, files in os.walk(self.directory.name)
+                 for f in files if f.endswith('.jpg')]
+        assert len(saved) == 4
+        for file in saved:
+            with open(file, 'rb') as f:
+                assert f.read() == PAYLOAD
+
+        # 再次运行时，已完成的作品及图片请求不再发出
+        self.site.hits.clear()
+        with Fingerprints(path) as fingerprints:
+            self.crawl(start_urls, fingerprints)
+        assert not [p for p in self.site.hits if p.startswith(('/works/', '/img/'))]
+
+    def test_iter_chunks(self):
+        """Test reading a ruia response in blocks through the underlying aiohttp response."""
+        async def read(url):
+            response = await Request(url).fetch()
+            # iter_chunks 依赖 ruia 的私有属性，ruia 升级后该属性变化时此处失败
+            assert hasattr(response._aws_read.__self__, 'content')
+            return [chunk async for chunk in cnu.iter_chunks(response, chunk_size=MB)]
+
+        chunks = self.loop.run_until_complete(read(f'{self.site.base}/img/a.jpg'))
+        assert [len(chunk) for chunk in chunks] == [MB, MB, 100]
+        assert b''.join(chunks) == PAYLOAD
+
+    def test_iter_chunks_fallback(self):
+        """Test reading the whole body when the aiohttp response is not available."""
+        class FakeResponse(object):
+            async def _aws_read(self):
+                return b'abc'
+
+            async def read(self):
+                return b'abc'
+
+        async def read():
+            return [chunk async for chunk in cnu.iter_chunks(FakeResponse())]
+
+        assert self.loop.run_until_complete(read()) == [b'abc']
+
+    def test_cancelled_download(self):
+        """Test that a download cancelled partway leaves neither the image nor the temporary file."""
+        path = os.path.join(self.directory.name, 'a', 'w', '[01]1.jpg')
+
+        async def cancel():
+            spider = cnu.CNUSpider(loop=self.loop, spider_config=dict(
+                _storage=LocalStorage(self.directory.name), _fingerprints=Fingerprints()))
+            response = await Request(f'{self.site.base}/slow/1.jpg', metadata=dict(
+                path='a/w/[01]1.jpg', url='1.jpg', work='w')).fetch()
+            task = self.loop.create_task(spider.save_image(response))
+            # 等待第一块内容写入磁盘
+            while not any(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(self.directory.name)
+                          for f in files):
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.site.release.set()
+            await spider.request_session.close()
+
+        self.loop.run_until_complete(cancel())
+        assert os.listdir(os.path.dirname(path)) == []
+
+    def test_stream_to_storage(self):
+        """Test that non-local storage receives each image block by block."""
+        storage = RecordingStorage()
+        self.loop.run_until_complete(cnu.CNUSpider.async_start(loop=self.loop, spider_config=dict(
+            start_urls=[f'{self.site.base}/works/1'], _storage=storage, _fingerprints=Fingerprints())))
+        assert sorted(storage.files) == ['a/w1/[01]1_0.jpg', 'a/w1/[02]1_1.jpg']
+        assert all(sizes == [MB, MB, 100] for sizes in storage.files.values())
+
+    def test_stream_aborted(self):
+        """Test that a failed read is passed to the storage so it can abort the upload."""
+        storage = RecordingStorage()
+
+        async def chunks():
+            yield b'a'
+            raise IOError('connection reset')
+
+        with self.assertRaises(IOError):
+            self.loop.run_until_complete(cnu.write_stream(storage, 'a.jpg', chunks()))
+        assert storage.aborted == ['a.jpg'] and not storage.files
@@ -0,0 +1,81 @@
+# @FILENAME : test_daemon
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from click.testing import CliRunner
+
+from scraper import zcool
+from scraper.daemon import Daemon, daemon_command, serve_control
+from tests.test_zcool import fake_request
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.watch_file = os.path.join(self.directory.name, 'watch.json')
+        with open(self.watch_file, 'w') as f:
+            json.dump([{'id': 1, 'interval': 60}], f)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resync_keeps_state(self):
+        urls = []
+
+        def tracking_request(url, method='GET', stream=False):
+            urls.append(url)
+            return fake_request(url, method, stream)
+
+        daemon = Daemon(self.watch_file, self.directory.name, max_workers=4, verbose=False)
+        with mock.patch.object(zcool, 'session_request', tracking_request):
+            daemon.sync('id:1')
+            assert daemon.status['id:1']['result'] == '8 images synced, 0 failed'
+            urls.clear()
+            daemon.sync('id:1')
+        assert daemon.status['id:1']['result'] == '0 images synced, 0 failed'
+        assert not [url for url in urls if url.startswith('https://img.zcool.cn/')]
+        # 再次同步只请求主页，不再请求已解析的作品
+        assert not [url for url in urls if '/work/content/show' in url]
+        assert not [f for f in os.listdir(self.directory.name) if f.endswith('.jsonl')]
+        assert 50 <= daemon.next_runs['id:1'] - time.time() <= 70
+
+    def test_control_interface(self):
+        daemon = Daemon(self.watch_file, self.directory.name, verbose=False)
+        server = serve_control(daemon, port=0)
+        base = f'http://127.0.0.1:{server.server_address[1]}/targets'
+        try:
+            body = json.dumps({'username': 'alice'}).encode()
+            with urlopen(Request(base, data=body, method='POST')) as resp:
+                assert json.load(resp) == {'key': 'username:alice'}
+            body = json.dumps({'username': 'bob', 'interval': '60'}).encode()
+            with self.assertRaises(HTTPError) as cm:
+                urlopen(Request(base, data=body, method='POST'))
+            assert cm.exception.code == 400
+            with urlopen(Request(f'{base}/username:alice/sync', method='POST')) as resp:
+                assert resp.status == 202
+            with urlopen(base) as resp:
+                assert [t['key'] for t in json.load(resp)] == ['id:1', 'username:alice']
+            with urlopen(Request(f'{base}/id:1', method='DELETE')) as resp:
+                assert resp.status == 200
+        finally:
+            server.shutdown()
+        with open(self.watch_file) as f:
+            assert json.load(f) == [{'username': 'alice'}]
+        assert daemon.next_target() == 'username:alice'
+
+    def test_invalid_watch_file(self):
+        """Test that an invalid watch file exits with a non-zero status."""
+        with open(self.watch_file, 'w') as f:
+            json.dump([{'id': 1, 'interval': 0}], f)
+        result = CliRunner().invoke(daemon_command, [self.watch_file, '-d', self.directory.name])
+        assert result.exit_code == 1
+        assert 'Interval must be a positive number' in result.output
@@ -0,0 +1,84 @@
+# @FILENAME : test_dedupe
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+from click.testing import CliRunner
+
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+
+from scraper import dedupe
+from scraper.dedupe import HashIndex, dedupe_command, dhash, hardlink_group
+
+
+@unittest.skipIf(np is None, 'requires numpy and Pillow')
+class TestDedupe(unittest.TestCase):
+
+    def test_query_matches_brute_force(self):
+        rng = random.Random(0)
+        hashes = [rng.getrandbits(64) for _ in range(2000)]
+        # 复制部分哈希并翻转少量位，模拟重新压缩的图片
+        hashes += [h ^ sum(1 << b for b in rng.sample(range(64), rng.randint(0, 6))) for h in hashes[:300]]
+        index = HashIndex(max_distance=4, batch_size=500)
+        for i, h in enumerate(hashes):
+            index.add(str(i), h)
+
+        i, j, distances = index.duplicates()
+        # 只需与复制出的哈希比较即可得到全部近似重复的对
+        expected = {(a, b) for b in range(2000, len(hashes)) for a in range(b)
+                    if bin(hashes[a] ^ hashes[b]).count('1') <= 4}
+        assert set(zip(i.tolist(), j.tolist())) == expected
+        assert all(bin(hashes[a] ^ hashes[b]).count('1') == d for a, b, d in zip(i, j, distances))
+
+    def test_command_hardlinks_near_duplicates(self):
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as directory:
+            for user in ('alice', 'bob'):
+                os.makedirs(os.path.join(directory, user))
+            image = Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).resize((256, 256))
+            image.save(os.path.join(directory, 'alice', 'a.png'))
+            image.resize((200, 200)).save(os.path.join(directory, 'bob', 'b.png'))
+            image.resize((200, 200)).save(os.path.join(directory, 'bob', 'b.jpg'), quality=70)
+            Image.fromarray(rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)).save(
+                os.path.join(directory, 'bob', 'c.png'))
+            assert dhash(os.path.join(directory, 'alice', 'a.png')) is not None
+
+            index_file = os.path.join(directory, 'index')
+            result = CliRunner().invoke(dedupe_command, [directory, '--hardlink', '--index', index_file])
+            assert result.exit_code == 0, result.output
+            assert 'Found 1 groups' in result.output
+            assert os.path.samefile(os.path.join(directory, 'alice', 'a.png'), os.path.join(directory, 'bob', 'b.png'))
+            # 格式不同的重复图片只输出，不替换
+            assert not os.path.samefile(os.path.join(directory, 'alice', 'a.png'),
+                                        os.path.join(directory, 'bob', 'b.jpg'))
+            assert not os.path.samefile(os.path.join(directory, 'alice', 'a.png'),
+                                        os.path.join(directory, 'bob', 'c.png'))
+
+            result = CliRunner().invoke(dedupe_command, [directory, '--index', index_file])
+            assert 'Hashed 0 new images, 4 images in index.' in result.output
+
+    def test_hardlink_within_distance_of_kept_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, name) for name in ('a.jpg', 'b.jpg', 'c.jpg')]
+            for size, path in zip((300, 200, 100), paths):
+                with open(path, 'wb') as f:
+                    f.write(os.urandom(size))
+            # a~b、b~c 的距离为 4，a、c 的距离为 8，传递合并为一组
+            hashes = dict(zip(paths, (0, 0xF, 0xFF)))
+            assert hardlink_group(paths, hashes, max_distance=4) == 200
+            assert os.path.samefile(paths[0], paths[1])
+            assert not os.path.samefile(paths[0], paths[2])
+
+    def test_missing_pillow(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.object(dedupe, 'PIL', None):
+            result = CliRunner().invoke(dedupe_command, [directory])
+        assert result.exit_code == 1
+        assert 'pip install numpy pillow' in result.output
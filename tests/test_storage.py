@@ -0,0 +1,84 @@
+# @FILENAME : test_storage
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import os
+import tempfile
+import unittest
+
+from scraper.storage import LocalStorage, S3Storage, open_storage
+from scraper.utils import MB
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    boto3 = None
+
+
+class TestLocalStorage(unittest.TestCase):
+
+    def test_write_and_exists(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = open_storage(directory).sub('user')
+            assert isinstance(storage, LocalStorage)
+            assert not storage.exists('title/[01]a.jpg')
+            storage.write('title/[01]a.jpg', [b'a', b'b'])
+            assert storage.exists('title/[01]a.jpg')
+            with open(os.path.join(directory, 'user', 'title', '[01]a.jpg'), 'rb') as f:
+                assert f.read() == b'ab'
+
+    def test_write_reused_buffer(self):
+        buffer = memoryview(bytearray(4))
+
+        def chunks():
+            for block in (b'abcd', b'ef'):
+                buffer[:len(block)] = block
+                yield buffer[:len(block)]
+
+        with tempfile.TemporaryDirectory() as directory:
+            storage = LocalStorage(directory)
+            # 预分配的大小多于实际内容时截去多余部分
+            storage.write('a.jpg', chunks(), size=10)
+            with open(os.path.join(directory, 'a.jpg'), 'rb') as f:
+                assert f.read() == b'abcdef'
+
+    def test_write_interrupted(self):
+        def chunks():
+            yield b'a'
+            raise IOError('connection reset')
+
+        with tempfile.TemporaryDirectory() as directory:
+            storage = LocalStorage(directory)
+            with self.assertRaises(IOError):
+                storage.write('a.jpg', chunks(), size=1000000)
+            assert not storage.exists('a.jpg')
+            assert os.listdir(directory) == []
+
+
+@unittest.skipIf(boto3 is None, 'requires boto3 and moto')
+class TestS3Storage(unittest.TestCase):
+
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.client = boto3.client('s3', region_name='us-east-1')
+        self.client.create_bucket(Bucket='images')
+        self.storage = S3Storage('images', 'prefix', client=self.client, part_size=5 * MB).sub('user')
+
+    def tearDown(self):
+        self.mock.stop()
+
+    def read(self, key):
+        return self.client.get_object(Bucket='images', Key=key)['Body'].read()
+
+    def test_put_object(self):
+        assert not self.storage.exists('title/a.jpg')
+        self.storage.write('title/a.jpg', [b'a', b'b'])
+        assert self.storage.exists('title/a.jpg')
+        assert self.read('prefix/user/title/a.jpg') == b'ab'
+
+    def test_multipart_upload(self):
+        chunks = [bytes([i]) * MB for i in range(12)]
+        self.storage.write('title/big.jpg', iter(chunks))
+        assert self.read('prefix/user/title/big.jpg') == b''.join(chunks)
+        assert not self.client.list_multipart_uploads(Bucket='images').get('Uploads')
@@ -0,0 +1,77 @@
+# @FILENAME : test_utils
+# @AUTHOR : lonsty
+# @DATE : 2026/10/19
+import os
+import socket
+import tempfile
+import unittest
+from unittest import mock
+
+from scraper.utils import (DNSCache, Fingerprints, PriorityTaskQueue,
+                           TaskSet, TokenBucket)
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_dns_cache(self):
+        calls = []
+
+        def getaddrinfo(host, port, family=0, type=0):
+            calls.append(host)
+            return [(socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('::1', port, 0, 0)),
+                    (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.%d' % len(calls), port)),
+                    (socket.AF_INET, socket.SOCK_STREAM, 17, '', ('127.0.0.%d' % len(calls), port))]
+
+        original = socket.getaddrinfo
+        with mock.patch.object(socket, 'getaddrinfo', getaddrinfo):
+            cache = DNSCache(ttl=60, maxsize=2)
+            # 缓存所有地址，由连接依次尝试
+            self.assertEqual(cache.resolve('a.com', 80), ['::1', '127.0.0.1'])
+            self.assertEqual(cache.resolve('a.com', 80), ['::1', '127.0.0.1'])
+            self.assertEqual(calls, ['a.com'])
+            cache.resolve('b.com', 80)
+            cache.resolve('c.com', 80)
+            # 缓存满时丢弃最早写入的结果
+            self.assertEqual(len(cache), 2)
+            cache.resolve('a.com', 80)
+            self.assertEqual(calls, ['a.com', 'b.com', 'c.com', 'a.com'])
+        self.assertIs(socket.getaddrinfo, original)
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=100, capacity=50)
+        self.assertEqual(bucket.reserve(50), 0)
+        self.assertAlmostEqual(bucket.reserve(100), 1, places=1)
+
+    def test_priority_task_queue(self):
+        queue = PriorityTaskQueue(key=lambda item: item[0])
+        for item in [(1, 'a'), (0, 'b'), (1, 'c'), (0, 'd')]:
+            queue.put(item)
+        self.assertEqual([queue.get()[1] for _ in range(4)], ['b', 'd', 'a', 'c'])
+
+    def test_task_set(self):
+        tasks = TaskSet([('image', 'a', 1)])
+        tasks.add(('image', 'b', 2))
+        self.assertEqual(len(tasks), 2)
+        self.assertIn(('image', 'b', 2), tasks)
+        self.assertNotIn(('image', 'a', 2), tasks)
+        urls = TaskSet(key=lambda task: task[1])
+        urls.add(('topic', 'a', 1))
+        self.assertIn(('topic', 'a', 5), urls)
+
+    def test_fingerprints(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'fingerprints')
+            with Fingerprints(path) as seen:
+                self.assertTrue(seen.add('http://www.cnu.cc/works/1'))
+                self.assertFalse(seen.add('https://www.cnu.cc/works/1/'))
+                self.assertTrue(seen.add('http://www.cnu.cc/works/1?page=2'))
+                seen.persist('http://www.cnu.cc/works/2')
+            self.assertEqual(os.path.getsize(path), 8)
+            seen = Fingerprints(path)
+            self.assertEqual(seen.loaded, 1)
+            self.assertIn('http://www.cnu.cc/works/2', seen)
+            self.assertNotIn('http://www.cnu.cc/works/1', seen)
+            seen.add('http://www.cnu.cc/users/1')
+            seen.reset()
+            self.assertNotIn('http://www.cnu.cc/users/1', seen)
+            self.assertIn('http://www.cnu.cc/works/2', seen)
@@ -1,10 +1,66 @@
 #!/usr/bin/env python
 """Tests for `zcooldl` package."""
+import base64
+import json
+import os
+import tempfile
 import unittest
+from itertools import islice
+from unittest import mock
 
 from click.testing import CliRunner
 
-from scraper.zcool import zcool_command
+from benchmarks import mock_cdn
+from benchmarks.mock_cdn import serve
+from scraper import zcool
+from scraper.zcool import (DirectorySink, Scrapy, ZCoolScraper, download,
+                           iter_images, zcool_command)
+
+try:
+    import cryptography
+except ImportError:
+    cryptography = None
+
+USER_HTML = '<div id="body" data-name="alice"></div><div id="laypage_0"><a>1</a><a>2</a><a>next</a></div>'
+CARD_HTML = '<a class="card-img-hover" title="{title}" href="https://www.zcool.com.cn/work/Z{work}.html"></a>'
+TOPIC_HTML = '<input id="dataInput" data-objid="{objid}">'
+
+
+class FakeResponse(object):
+
+    def __init__(self, text='', content=b''):
+        self.text = text
+        self.content = content
+
+    def json(self):
+        return json.loads(self.text)
+
+    def iter_content(self, chunk_size):
+        yield self.content
+
+    def close(self):
+        pass
+
+
+def fake_request(url, method='GET', stream=False):
+    """模拟站酷：用户 1 有 2 页作品，每页 2 个主题，每个主题 2 张图片。"""
+    if url.endswith('/u/1'):
+        return FakeResponse(USER_HTML)
+    if '/u/1?' in url:
+        page = url.split('p=')[-1]
+        works = [base64.b64encode(f'{page}{i}'.encode()).decode() for i in range(2)]
+        return FakeResponse(''.join(CARD_HTML.format(title=f't{page}{i}', work=work) for i, work in enumerate(works)))
+    if '/work/content/show' in url:
+        objid = url.split('objectId=')[-1]
+        return FakeResponse(json.dumps({'data': {
+            'product': {'id': objid, 'title': f'title{objid}', 'creatorObj': {'username': 'alice'}},
+            'allImageList': [{'orderNo': i, 'url': f'https://img.zcool.cn/{objid}_{i}.jpg'} for i in range(2)]
+        }}))
+    if '/work/Z' in url:
+        return FakeResponse(TOPIC_HTML.format(objid=base64.b64decode(url.split('/work/Z')[-1][:-5]).decode()))
+    if url.startswith('https://img.zcool.cn/'):
+        return FakeResponse(content=url.encode())
+    raise ValueError(url)
 
 
 class TestZcooldl(unittest.TestCase):
@@ -12,9 +68,12 @@ class TestZcooldl(unittest.TestCase):
 
     def setUp(self):
         """Set up test fixtures, if any."""
+        self.patcher = mock.patch.object(zcool, 'session_request', fake_request)
+        self.patcher.start()
 
     def tearDown(self):
         """Tear down test fixtures, if any."""
+        self.patcher.stop()
 
     def test_000_something(self):
         """Test something."""
@@ -28,3 +87,200 @@ class TestZcooldl(unittest.TestCase):
         help_result = runner.invoke(zcool_command, ['--help'])
         assert help_result.exit_code == 0
         assert 'Show this message and exit.' in help_result.output
+
+    def test_iter_images(self):
+        """Test streaming image records without downloading."""
+        records = list(iter_images(user_id=1, max_workers=4))
+        assert len(records) == 8
+        assert {r.author for r in records} == {'alice'}
+        assert len(list(islice(iter_images(user_id=1, max_workers=4), 3))) == 3
+
+    def test_topic_objid_from_url(self):
+        """Test that topics get the objid from the work URL without requesting the topic page."""
+        urls = []
+
+        def tracking_request(url, method='GET', stream=False):
+            urls.append(url)
+            return fake_request(url, method, stream)
+
+        with mock.patch.object(zcool, 'session_request', tracking_request):
+            records = list(iter_images(user_id=1, max_workers=4))
+        assert {r.objid for r in records} == {'10', '11', '20', '21'}
+        assert not [url for url in urls if '/work/Z' in url]
+
+    def test_stage_pools(self):
+        """Test that single-threaded stages still finish, coordinators do not occupy the stage pools."""
+        with tempfile.TemporaryDirectory() as directory:
+            scraper = ZCoolScraper(user_id=1, destination=directory, max_workers=1, page_workers=1,
+                                   topic_workers=1, keep_records=False, verbose=False)
+            assert scraper.stat['nimages'] == 8
+            scraper.run_scraper()
+            scraper.shutdown()
+            assert len(scraper.stat['images_pass']) == 8
+
+    def test_download(self):
+        """Test downloading streamed records into a sink."""
+        with tempfile.TemporaryDirectory() as directory:
+            results = list(download(iter_images(user_id=1, max_workers=4), DirectorySink(directory)))
+            assert len(results) == 8
+            assert all(error is None for _, error in results)
+            saved = [os.path.join(root, f) for root, _, files in os.walk(directory) for f in files]
+            assert len(saved) == 8
+
+    def test_metadata_only(self):
+        """Test exporting metadata without downloading images."""
+        with tempfile.TemporaryDirectory() as directory:
+            scraper = ZCoolScraper(user_id=1, destination=directory, max_workers=4,
+                                   metadata_only=True, verbose=False)
+            scraper.run_scraper()
+            with open(scraper.metadata.path, encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+            assert len(records) == 8
+            assert set(records[0]) == {'author', 'title', 'objid', 'index', 'url'}
+            assert not any(f.endswith('.jpg') for _, _, files in os.walk(directory) for f in files)
+
+    def test_records(self):
+        """Test streaming run records and redownloading failed images from them."""
+        def failing_request(url, method='GET', stream=False):
+            if url.endswith('10_1.jpg'):
+                raise ValueError(url)
+            return fake_request(url, method, stream)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.object(zcool, 'session_request', failing_request):
+                scraper = ZCoolScraper(user_id=1, destination=directory, max_workers=4, verbose=False)
+                scraper.run_scraper()
+            path = scraper.records.path
+            with open(path, encoding='utf-8') as f:
+                statuses = [json.loads(line).get('status') for line in f]
+            assert statuses.count('fail') == 1
+            assert statuses.count('success') == 2 + 4 + 7
+
+            retry = ZCoolScraper(redownload=str(path), destination=directory, max_workers=4,
+                                 verbose=False, autorun=False)
+            assert retry.reload_records(str(path)) == 'alice'
+            assert retry.images.get().url.endswith('10_1.jpg')
+
+            # 只导出元数据时，重新加载的失败图片也写入元数据文件
+            with mock.patch.object(ZCoolScraper, 'search_id_by_username', return_value='1'):
+                metadata = ZCoolScraper(redownload=str(path), destination=directory, max_workers=4,
+                                        metadata_only=True, keep_records=False, verbose=False)
+            metadata.run_scraper()
+            metadata.shutdown()
+            with open(metadata.metadata.path, encoding='utf-8') as f:
+                assert [json.loads(line)['url'] for line in f] == ['https://img.zcool.cn/10_1.jpg']
+
+    def test_reload_without_failures(self):
+        """Test that redownloading from records without failures raises ZCoolError."""
+        with tempfile.TemporaryDirectory() as directory:
+            scraper = ZCoolScraper(user_id=1, destination=directory, max_workers=4, verbose=False)
+            scraper.run_scraper()
+            path = str(scraper.records.path)
+            with self.assertRaisesRegex(zcool.ZCoolError, 'No failed records'):
+                ZCoolScraper(redownload=path, destination=directory, max_workers=4, verbose=False)
+            result = CliRunner().invoke(zcool_command, ['--redownload', path, '-d', directory])
+            assert result.exit_code == 1
+            assert 'No failed records' in result.output
+
+    def test_image_priority(self):
+        """Test that images dequeue work by work, in index order, with retried records last."""
+        def work_request(url, method='GET', stream=False):
+            # 作品 1 有 3 张图片，作品 2 有 1 张，接口返回的图片顺序与序号相反
+            objid = url.split('objectId=')[-1]
+            return FakeResponse(json.dumps({'data': {
+                'product': {'id': objid, 'title': f'title{objid}', 'creatorObj': {'username': 'alice'}},
+                'allImageList': [{'orderNo': i, 'url': f'https://img.zcool.cn/{objid}_{i}.jpg'}
+                                 for i in reversed(range(3 if objid == '1' else 1))]
+            }}))
+
+        def dequeue(small_first):
+            scraper = ZCoolScraper(user_id=1, max_workers=4, small_first=small_first, keep_records=False,
+                                   verbose=False, autorun=False)
+            # 下载记录中失败过的图片先入队
+            retried = Scrapy('image', 'alice', 'title9', '9', 0, 'https://img.zcool.cn/9_0.jpg')
+            scraper.retried.add(retried)
+            scraper.images.put(retried)
+            with mock.patch.object(zcool, 'session_request', work_request):
+                for objid in ('1', '2'):
+                    scraper.parse_images(Scrapy('topic', 'alice', f'title{objid}', objid, 0, ''))
+            scraper.shutdown()
+            order = []
+            while not scraper.images.empty():
+                order.append(scraper.images.get_nowait().url.rsplit('/', 1)[-1][:-4])
+            return order
+
+        assert dequeue(small_first=False) == ['1_0', '1_1', '1_2', '2_0', '9_0']
+        assert dequeue(small_first=True) == ['2_0', '1_0', '1_1', '1_2', '9_0']
+
+
+class TestTransport(unittest.TestCase):
+    """Tests for the shared transport against the local mock CDN."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = serve()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def test_dns_cache_tries_every_address(self):
+        """Test that a connection falls back to the next cached address when the first is unreachable."""
+        port = self.server.server_address[1]
+        pool = zcool.CountingHTTPConnectionPool('localhost', port)
+        # 模拟服务只监听 127.0.0.1，而解析出的第一个地址无法连接
+        with mock.patch.object(zcool.dns_cache, 'resolve', return_value=['127.0.0.2', '127.0.0.1']):
+            resp = pool.request('GET', '/10/a.jpg')
+        assert resp.data and len(resp.data) == 10
+
+
+@unittest.skipIf(zcool.httpx is None or mock_cdn.h2 is None or cryptography is None,
+                 'requires httpx[http2] and cryptography')
+class TestHTTP2(unittest.TestCase):
+    """Tests for the shared httpx client against the local mock CDN over TLS and h2."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server, cls.base_url = serve(tls=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.certdir.cleanup()
+
+    def setUp(self):
+        # httpx 创建客户端时从 SSL_CERT_FILE 读取信任的证书
+        with mock.patch.dict(os.environ, SSL_CERT_FILE=self.server.cafile):
+            self.scraper = ZCoolScraper(http2=True, max_workers=4, keep_records=False, verbose=False,
+                                        autorun=False)
+        zcool.transport_stats.clear()
+
+    def tearDown(self):
+        self.scraper.shutdown()
+        zcool.configure_transport()
+        zcool.transport_stats.clear()
+
+    def test_session_request(self):
+        """Test that requests go through the shared client over HTTP/2 and stream in blocks."""
+        resp = zcool.session_request(f'{self.base_url}/{3 * zcool.BUFFER_SIZE + 10}/a.jpg', stream=True)
+        assert isinstance(resp, zcool.httpx.Response) and resp.http_version == 'HTTP/2'
+        try:
+            blocks = [len(block) for block in zcool.iter_blocks(resp, zcool.thread_buffer())]
+        finally:
+            resp.close()
+        assert sum(blocks) == 3 * zcool.BUFFER_SIZE + 10
+        assert max(blocks) <= zcool.BUFFER_SIZE
+        assert zcool.get_transport_stats() == {'requests': 1, 'connections': 0, 'reused': None}
+
+    def test_download_image(self):
+        """Test downloading images concurrently over the multiplexed connection."""
+        with tempfile.TemporaryDirectory() as directory:
+            self.scraper.sink = DirectorySink(directory)
+            scrapies = [Scrapy('image', 'alice', 'work', '1', i, f'{self.base_url}/{100000 + i}/{i}.jpg')
+                        for i in range(8)]
+            list(self.scraper.download_pool.map(self.scraper.download_image, scrapies))
+            for scrapy in scrapies:
+                with open(os.path.join(directory, self.scraper.sink.path(scrapy)), 'rb') as f:
+                    assert f.read() == mock_cdn.PAYLOAD[:100000 + scrapy.index]
+        assert zcool.get_transport_stats()['requests'] == 8
+        assert zcool.get_transport_stats()['reused'] is None